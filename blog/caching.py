@@ -0,0 +1,105 @@
+"""Caching of the rendered blog listing fragments and category navigation.
+
+``post_list`` renders the grid of post cards (with its pagination) for a
+given category and page, which is identical for every visitor and is
+cached as rendered HTML.
+
+The category navigation (``get_category_nav()``) is cached as data: each
+category's name, slug, URL and number of published posts. It is shared
+by every page showing categories through the ``{% category_nav %}`` tag
+(see ``blog/templatetags/blog_tags.py``).
+
+Invalidation is targeted through the version counters of
+``core.cache``: each listing (all posts, or the posts of one category)
+has its own version, which is part of the cache keys of its pages.
+Changing a post only bumps the versions of the listings it appears in,
+so the cached pages of other categories stay valid; old keys simply
+expire. The category navigation has its own version, bumped when a
+category changes or a post is published, unpublished or moved. The
+signal handlers doing this live in ``blog/signals.py``. Versions are
+bumped once the transaction commits: a page rendered before the commit
+shows the old posts and must not be cached under the new version.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from core.cache import get_version, bump_version
+
+from .models import Category
+
+# Version of the unfiltered listing (/blog/)
+ALL_POSTS_VERSION = 'blog:posts'
+# Version of the category navigation
+CATEGORIES_VERSION = 'blog:categories'
+
+
+def listing_version_name(category_slug=None):
+    """Return the name of the version counter of a listing."""
+
+    return f'{ALL_POSTS_VERSION}:{category_slug}' if category_slug else ALL_POSTS_VERSION
+
+
+def grid_cache_key(category_slug, page):
+    """Cache key of the rendered post grid for a category (or all) and page."""
+
+    version = get_version(listing_version_name(category_slug))
+    return f'blog:grid:{category_slug or "-"}:{version}:{page}'
+
+
+def get_category_nav():
+    """Return the category navigation, built with one query on a cache miss.
+
+    A list of ``{'name', 'slug', 'url', 'post_count'}`` dicts in
+    category order; ``post_count`` only counts published posts.
+    """
+
+    def build():
+        categories = Category.objects.annotate(
+            post_count=Count('posts', filter=Q(posts__published=True)),
+        )
+        return [
+            {'name': category.name, 'slug': category.slug,
+             'url': category.get_absolute_url(), 'post_count': category.post_count}
+            for category in categories
+        ]
+
+    return get_or_render(f'blog:category_nav:{get_version(CATEGORIES_VERSION)}', build)
+
+
+def get_or_render(key, render):
+    """Return the cached value for ``key``, calling ``render()`` on a miss."""
+
+    value = cache.get(key)
+    if value is None:
+        value = render()
+        cache.set(key, value, settings.BLOG_CACHE_TIMEOUT)
+    return value
+
+
+def _bump_versions(names):
+    # Bump once the current transaction commits (at once outside of one)
+    def bump():
+        for name in names:
+            bump_version(name)
+    transaction.on_commit(bump)
+
+
+def invalidate_listings(category_slugs):
+    """Invalidate the unfiltered listing and those of the given categories."""
+
+    _bump_versions([ALL_POSTS_VERSION, *map(listing_version_name, category_slugs)])
+
+
+def invalidate_category_nav():
+    """Invalidate the category navigation (e.g. after post counts changed)."""
+
+    _bump_versions([CATEGORIES_VERSION])
+
+
+def invalidate_categories(category_slugs):
+    """Invalidate the category navigation and the listings of the given categories."""
+
+    _bump_versions([CATEGORIES_VERSION, *map(listing_version_name, category_slugs)])
@@ -0,0 +1,185 @@
+"""RSS and Atom feeds of the blog.
+
+Feeds of the latest published posts, for the whole blog and for each
+category, built with Django's syndication framework. They are served
+by ``serve_feed`` rather than by the ``Feed`` views directly so that:
+
+- a poll finding no change costs one indexed query: the feed's ``ETag``
+  (latest ``Post.updated`` and number of published posts of the feed)
+  is checked against ``If-None-Match`` first and answered with 304;
+- a changed feed is generated once and cached by validator, so all
+  readers polling after a change share one rendering;
+- the document is streamed item by item while it is being generated.
+
+No ``Last-Modified`` is sent: the latest update of the published posts
+doesn't move when a post is unpublished or deleted, and its one-second
+resolution hides a post published in the second of a poll, so readers
+revalidating with ``If-Modified-Since`` would keep a stale feed. The
+``ETag`` changes in both cases (see ``core/conditional.py`` for the
+same choice on pages).
+"""
+
+import io
+
+from django.core.cache import cache
+from django.contrib.syndication.views import Feed
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse_lazy
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.xmlutils import SimplerXMLGenerator
+from django.views.decorators.http import condition
+
+from core.cache import get_version, stream_and_cache
+from core.conditional import make_etag
+
+from .caching import CATEGORIES_VERSION
+from .models import Category, Post
+
+# Number of posts listed in a feed
+FEED_ITEMS = 20
+
+# How long a rendered feed stays cached (it is keyed by its validator, so
+# a change never serves a stale copy)
+FEED_CACHE_TIMEOUT = 60 * 60
+
+
+class LatestPostsFeed(Feed):
+    """RSS feed of the latest published posts."""
+
+    title = 'Coffo Blog'
+    link = reverse_lazy('blog:post_list')
+    description = 'The latest posts from the Coffo blog.'
+
+    def posts(self):
+        # Only the columns used by the feed items, never the article body
+        return (
+            Post.objects.filter(published=True)
+            .only('title', 'slug', 'summary', 'created', 'updated')
+            .order_by('-created')
+        )
+
+    def items(self):
+        return self.posts()[:FEED_ITEMS]
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return item.summary
+
+    def item_pubdate(self, item):
+        return item.created
+
+    def item_updateddate(self, item):
+        return item.updated
+
+
+class AtomLatestPostsFeed(LatestPostsFeed):
+    """Atom version of ``LatestPostsFeed``."""
+
+    feed_type = Atom1Feed
+    subtitle = LatestPostsFeed.description
+
+
+class CategoryFeed(LatestPostsFeed):
+    """RSS feed of the latest published posts of one category."""
+
+    def get_object(self, request, category_slug):
+        return get_object_or_404(Category, slug=category_slug)
+
+    def title(self, obj):
+        return f'Coffo Blog: {obj.name}'
+
+    def link(self, obj):
+        return obj.get_absolute_url()
+
+    def description(self, obj):
+        return f'The latest {obj.name} posts from the Coffo blog.'
+
+    def items(self, obj):
+        return self.posts().filter(category=obj)[:FEED_ITEMS]
+
+
+class AtomCategoryFeed(CategoryFeed):
+    """Atom version of ``CategoryFeed``."""
+
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
+
+
+def _feed_state(request, category_slug=None):
+    # (latest Post.updated, number of posts) of the feed's published posts,
+    # computed once per request with one aggregate over the
+    # (category, published, updated) / (published, updated) indexes
+    if not hasattr(request, '_feed_state'):
+        posts = Post.objects.filter(published=True)
+        if category_slug:
+            posts = posts.filter(category__slug=category_slug)
+        state = posts.aggregate(latest=Max('updated'), count=Count('pk'))
+        request._feed_state = state['latest'], state['count']
+    return request._feed_state
+
+
+def _feed_etag(request, category_slug=None):
+    latest, count = _feed_state(request, category_slug)
+    # Deleting a post changes the count; renaming a category changes its feed
+    # title. The absolute URL is included because the feed embeds absolute links.
+    return make_etag(request.build_absolute_uri(), latest, count, get_version(CATEGORIES_VERSION))
+
+
+def _stream(feedgen):
+    # Serialize the feed like SyndicationFeed.write(), yielding the
+    # document after the header and after every item
+    buffer = io.StringIO()
+    handler = SimplerXMLGenerator(buffer, 'utf-8', short_empty_elements=True)
+
+    def flush():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    handler.startDocument()
+    if isinstance(feedgen, Atom1Feed):
+        handler.startElement('feed', feedgen.root_attributes())
+        item_element, closing_elements = 'entry', ('feed',)
+    else:
+        handler.startElement('rss', feedgen.rss_attributes())
+        handler.startElement('channel', feedgen.root_attributes())
+        item_element, closing_elements = 'item', ('channel', 'rss')
+    feedgen.add_root_elements(handler)
+    yield flush()
+
+    for item in feedgen.items:
+        handler.startElement(item_element, feedgen.item_attributes(item))
+        feedgen.add_item_elements(handler, item)
+        handler.endElement(item_element)
+        yield flush()
+
+    for element in closing_elements:
+        handler.endElement(element)
+    yield flush()
+
+
+def serve_feed(feed_class):
+    """Return a view serving ``feed_class`` with conditional GET and caching."""
+
+    @condition(etag_func=_feed_etag)
+    def view(request, category_slug=None):
+        feed = feed_class()
+        key = f'blog:feed:{_feed_etag(request, category_slug)}'
+        document = cache.get(key)
+        if document is not None:
+            content = [document]
+        else:
+            obj = feed.get_object(request, category_slug) if category_slug else None
+            feedgen = feed.get_feed(obj, request)
+            content = stream_and_cache(_stream(feedgen), key, FEED_CACHE_TIMEOUT)
+        return StreamingHttpResponse(content, content_type=feed_class.feed_type.content_type)
+
+    return view
+
@@ -0,0 +1,437 @@
+"""Write-behind ingestion of blog comments.
+
+With ``BLOG_COMMENT_INGESTION = 'buffered'`` validated comments are not
+inserted by the request that submitted them. They are appended to a
+bounded in-process buffer and a background thread inserts them in
+batches with ``bulk_create``, so a burst of comments costs a few
+multi-row INSERTs instead of one write transaction (and one wait on the
+SQLite lock) per comment.
+
+Durability: every accepted comment is also appended to a spool file
+(one JSON object per line) before the request returns. Each process has
+its own spool, named after ``BLOG_COMMENT_SPOOL`` and its pid
+(``comments.<pid>.jsonl``), and holds an exclusive lock on a companion
+``.lock`` file for as long as it runs. The spool is rewritten with
+whatever is still pending after each flush. A starting process takes
+over the spools of processes that died (their lock is free) and reloads
+their comments; spools of live processes are never read or rewritten.
+Comments already inserted before the crash are recognised and not
+inserted twice.
+
+Failures: comments on posts deleted since they were submitted are
+dropped (and logged) before the insert. When a batch fails anyway, its
+comments are inserted one by one: one that fails with a database error
+other than an outage (``OperationalError``), e.g. a constraint error,
+is dropped and logged with its content so that it never holds up the
+queue; during an outage the comments stay pending and are retried.
+
+Backpressure: when ``BLOG_COMMENT_BUFFER_SIZE`` comments are pending,
+``submit()`` waits up to ``BLOG_COMMENT_SUBMIT_TIMEOUT`` seconds for
+the flusher to make room and then raises ``BufferFull``.
+
+Each process has its own buffer; ``get_comment_buffer().stats()``
+reports queue depth, batch sizes and flush latency for this process.
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.search.cache import invalidate_search_cache
+from core.search.fts import index_objects
+
+from .models import Comment, Post
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Number of recent batches kept for the latency/batch size statistics
+STATS_WINDOW = 100
+
+
+class BufferFull(Exception):
+    """Raised when the comment buffer stays full for the submit timeout."""
+
+
+def _try_lock(path):
+    # Open and exclusively lock ``path``; None if another process holds the lock
+    lock_file = open(path, 'a')
+    if fcntl is None:
+        # Without flock, spools of live processes can't be told from orphans
+        lock_file.close()
+        return None
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class CommentBuffer:
+    """Bounded buffer of pending comments flushed by a background thread.
+
+    ``spool_path`` names the spools: this buffer writes to
+    ``<root>.<worker><ext>``, ``worker`` defaulting to the pid.
+    """
+
+    def __init__(self, spool_path, capacity=1000, batch_size=100,
+                 flush_interval=1.0, submit_timeout=2.0, worker=None):
+        self._spool_root, self._spool_ext = os.path.splitext(spool_path)
+        worker = os.getpid() if worker is None else worker
+        self.spool_path = f'{self._spool_root}.{worker}{self._spool_ext}'
+        self._lock_path = f'{self._spool_root}.{worker}.lock'
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.submit_timeout = submit_timeout
+
+        self._pending = deque()
+        self._lock = threading.Lock()
+        # Signalled when comments are added (wakes the flusher) and when a
+        # flush frees room (wakes waiting submitters)
+        self._changed = threading.Condition(self._lock)
+        # Serializes flushes (the flusher thread and explicit flush() calls)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+        self._submitted = self._flushed = self._dropped = self._rejected = self._failed_flushes = 0
+        self._batches = deque(maxlen=STATS_WINDOW)
+
+        os.makedirs(os.path.dirname(spool_path), exist_ok=True)
+        self._lock_file = _try_lock(self._lock_path) if fcntl else open(self._lock_path, 'a')
+        if self._lock_file is None:
+            raise RuntimeError(f'{self.spool_path} is used by another process')
+        self._recover()
+        if self._pending:
+            self._ensure_flusher()
+
+    # Submitting
+
+    def submit(self, comment):
+        """Queue an unsaved, validated ``Comment`` for insertion.
+
+        Raises ``BufferFull`` if there is still no room after waiting
+        ``submit_timeout`` seconds.
+        """
+
+        record = {
+            'post_id': comment.post_id,
+            'name': comment.name,
+            'email': comment.email,
+            'content': comment.content,
+            'active': comment.active,
+            'submitted': timezone.now().isoformat(),
+        }
+        with self._changed:
+            deadline = time.monotonic() + self.submit_timeout
+            while len(self._pending) >= self.capacity:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._rejected += 1
+                    raise BufferFull
+                self._changed.wait(remaining)
+
+            self._append_to_spool(record)
+            self._pending.append((time.monotonic(), record))
+            self._submitted += 1
+            self._ensure_flusher()
+            if len(self._pending) >= self.batch_size:
+                self._changed.notify_all()
+
+    # Flushing
+
+    def flush(self):
+        """Insert all pending comments now (also used at interpreter exit)."""
+
+        while self._flush_batch():
+            pass
+
+    def _flush_batch(self):
+        # Insert up to batch_size comments; returns the number inserted
+        with self._flush_lock:
+            return self._insert_batch()
+
+    def _insert_batch(self):
+        with self._lock:
+            records = [self._pending[i][1] for i in range(min(self.batch_size, len(self._pending)))]
+        if not records:
+            return 0
+
+        started = time.monotonic()
+        close_old_connections()
+        try:
+            inserted, dropped = self._insert(records)
+        except Exception:
+            # Retry the comments one by one, so that one that can't be
+            # inserted doesn't hold up the others
+            self._failed_flushes += 1
+            logger.exception('Could not insert %d buffered comments', len(records))
+            inserted, dropped = self._insert_one_by_one(records)
+        done = len(inserted) + len(dropped)
+        if not done:
+            # The database is unavailable: the comments stay pending (and
+            # spooled) and are retried on the next cycle
+            return 0
+
+        finished = time.monotonic()
+        with self._changed:
+            # The comments done are the first ``done`` pending ones
+            oldest = self._pending[0][0]
+            for _ in range(done):
+                self._pending.popleft()
+            self._rewrite_spool()
+            self._flushed += len(inserted)
+            self._dropped += len(dropped)
+            self._batches.append((done, finished - started, finished - oldest))
+            self._changed.notify_all()
+
+        if inserted:
+            # bulk_create sends no post_save signals: update the counts ourselves
+            from .signals import update_comment_counts
+            update_comment_counts({record['post_id'] for record in inserted})
+        logger.debug('Inserted %d buffered comments in %.1f ms',
+                     len(inserted), (finished - started) * 1000)
+        return done
+
+    def _insert(self, records):
+        # Insert ``records`` in one transaction; returns (inserted, dropped)
+        with transaction.atomic():
+            # Posts deleted since the comments were submitted: their
+            # comments can never be inserted
+            posts = Post.objects.only('published').in_bulk({record['post_id'] for record in records})
+            dropped = [record for record in records if record['post_id'] not in posts]
+            for record in dropped:
+                logger.warning('Dropping a buffered comment on deleted post %s: %s',
+                               record['post_id'], json.dumps(record))
+            inserted = [record for record in records if record['post_id'] in posts]
+            comments = Comment.objects.bulk_create([
+                Comment(
+                    post_id=record['post_id'], name=record['name'], email=record['email'],
+                    content=record['content'], active=record['active'],
+                )
+                for record in inserted
+            ])
+            # No post_save signals either: add the comments to the search
+            # index, with the posts loaded above
+            for comment in comments:
+                comment.post = posts[comment.post_id]
+            index_objects(comments)
+            invalidate_search_cache()
+        return inserted, dropped
+
+    def _insert_one_by_one(self, records):
+        # Insert the records in order, each in its own transaction. A record
+        # failing with a database error that isn't an outage is dropped
+        # (and logged); an outage stops at the record it happened on.
+        inserted, dropped = [], []
+        for record in records:
+            try:
+                done, gone = self._insert([record])
+            except (OperationalError, InterfaceError):
+                logger.exception('Database unavailable, %d buffered comments left pending',
+                                 len(records) - len(inserted) - len(dropped))
+                break
+            except Exception:
+                logger.exception('Dropping a buffered comment that cannot be inserted: %s',
+                                 json.dumps(record))
+                done, gone = [], [record]
+            inserted.extend(done)
+            dropped.extend(gone)
+        return inserted, dropped
+
+    def _run(self):
+        while True:
+            with self._changed:
+                if not self._stopping and len(self._pending) < self.batch_size:
+                    self._changed.wait(self.flush_interval)
+                if self._stopping:
+                    return
+            try:
+                while self._flush_batch() == self.batch_size:
+                    pass
+            except Exception:
+                logger.exception('Comment flusher error')
+
+    def _ensure_flusher(self):
+        # Started on first use so management commands never spawn the thread
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='comment-flusher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flusher thread and insert what is still pending."""
+
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        with self._lock:
+            if not self._pending:
+                # Nothing left to recover: don't leave one spool per pid behind
+                _remove(self.spool_path)
+                _remove(self._lock_path)
+        self._lock_file.close()
+
+    # Spool file
+
+    def _append_to_spool(self, record):
+        with open(self.spool_path, 'a', encoding='utf-8') as spool:
+            spool.write(json.dumps(record) + '\n')
+            spool.flush()
+            os.fsync(spool.fileno())
+
+    def _rewrite_spool(self):
+        # Replace the spool with the still pending comments (atomically)
+        if not self._pending:
+            open(self.spool_path, 'w').close()
+            return
+        tmp_path = self.spool_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as spool:
+            for _, record in self._pending:
+                spool.write(json.dumps(record) + '\n')
+            spool.flush()
+            os.fsync(spool.fileno())
+        os.replace(tmp_path, self.spool_path)
+
+    @staticmethod
+    def _read_spool(path):
+        try:
+            with open(path, encoding='utf-8') as spool:
+                lines = spool.readlines()
+        except FileNotFoundError:
+            return []
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Torn last line of a crashed write: that comment was never acknowledged
+                continue
+        return records
+
+    def _recover(self):
+        # Reload the comments left in this spool by a previous process with
+        # the same pid and in the spools of dead processes (whose lock could
+        # be taken), skipping the ones that were already inserted
+        records = self._read_spool(self.spool_path)
+        orphans = []
+        for lock_path in glob.glob(glob.escape(self._spool_root) + '.*.lock'):
+            if lock_path == self._lock_path:
+                continue
+            lock_file = _try_lock(lock_path)
+            if lock_file is None:
+                continue  # its process is still running
+            spool_path = lock_path[:-len('.lock')] + self._spool_ext
+            records.extend(self._read_spool(spool_path))
+            orphans.append((lock_path, spool_path, lock_file))
+
+        # A crash while taking over an orphan can leave its comments in two
+        # spools: keep one copy
+        unique = {json.dumps(record, sort_keys=True): record for record in records}
+        records = [record for record in unique.values() if not self._already_inserted(record)]
+        now = time.monotonic()
+        self._pending.extend((now, record) for record in records)
+        self._rewrite_spool()
+
+        # The comments are in this spool now: drop the orphans
+        for lock_path, spool_path, lock_file in orphans:
+            _remove(spool_path)
+            _remove(spool_path + '.tmp')
+            _remove(lock_path)
+            lock_file.close()
+        if records:
+            logger.info('Recovered %d spooled comments', len(records))
+
+    def _already_inserted(self, record):
+        # A crash between the INSERT and the spool rewrite leaves inserted
+        # comments in the spool
+        return Comment.objects.filter(
+            post_id=record['post_id'], name=record['name'], email=record['email'],
+            content=record['content'], created__gte=parse_datetime(record['submitted']),
+        ).exists()
+
+    # Statistics
+
+    def stats(self):
+        """Return counters, queue depth, batch sizes and flush latency (ms)."""
+
+        with self._lock:
+            batches = list(self._batches)
+            stats = {
+                'pending': len(self._pending),
+                'capacity': self.capacity,
+                'submitted': self._submitted,
+                'flushed': self._flushed,
+                'dropped': self._dropped,
+                'rejected': self._rejected,
+                'failed_flushes': self._failed_flushes,
+                'flusher_running': self._thread is not None and self._thread.is_alive(),
+            }
+        sizes = [size for size, _, _ in batches]
+        durations = [duration * 1000 for _, duration, _ in batches]
+        # Latency: time the oldest comment of each batch waited before insertion
+        latencies = [latency * 1000 for _, _, latency in batches]
+        stats['recent_batches'] = {
+            'count': len(batches),
+            'avg_size': sum(sizes) / len(sizes) if sizes else None,
+            'max_size': max(sizes, default=None),
+            'avg_insert_ms': sum(durations) / len(durations) if durations else None,
+            'avg_latency_ms': sum(latencies) / len(latencies) if latencies else None,
+            'max_latency_ms': max(latencies, default=None),
+        }
+        return stats
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_comment_buffer():
+    """Return this process's ``CommentBuffer``, creating it on first use."""
+
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = CommentBuffer(
+                    str(settings.BLOG_COMMENT_SPOOL),
+                    capacity=settings.BLOG_COMMENT_BUFFER_SIZE,
+                    batch_size=settings.BLOG_COMMENT_BATCH_SIZE,
+                    flush_interval=settings.BLOG_COMMENT_FLUSH_INTERVAL,
+                    submit_timeout=settings.BLOG_COMMENT_SUBMIT_TIMEOUT,
+                )
+                # Insert what is still buffered when the process exits normally
+                atexit.register(_buffer.stop)
+    return _buffer
+
+
+def buffering_enabled():
+    """Whether comments are ingested through the buffer."""
+
+    return getattr(settings, 'BLOG_COMMENT_INGESTION', 'sync') == 'buffered'
@@ -0,0 +1,44 @@
+"""Fill in ``Post.summary`` for existing posts.
+
+Posts get their summary when saved; this command computes it for posts
+created before the field existed (or for every post with ``--all``,
+e.g. after changing how summaries are built).
+
+Usage:
+    python manage.py backfill_post_summaries [--all] [--batch-size N]
+"""
+
+from django.core.management.base import BaseCommand
+
+from blog.caching import invalidate_listings
+from blog.models import Category, Post
+
+
+class Command(BaseCommand):
+    help = 'Compute the listing summary of blog posts that do not have one yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute the summary of every post.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of posts updated per query.')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.only('pk', 'content', 'excerpt', 'summary').order_by('pk')
+        if not options['all']:
+            posts = posts.filter(summary='')
+
+        batch, updated = [], 0
+        for post in posts.iterator(chunk_size=options['batch_size']):
+            summary = post.build_summary()
+            if summary != post.summary:
+                post.summary = summary
+                batch.append(post)
+            if len(batch) >= options['batch_size']:
+                updated += Post.objects.bulk_update(batch, ['summary'])
+                batch = []
+        if batch:
+            updated += Post.objects.bulk_update(batch, ['summary'])
+
+        if updated:
+            # bulk_update() sends no signals: drop the cached listings ourselves
+            invalidate_listings(Category.objects.values_list('slug', flat=True))
+        self.stdout.write(self.style.SUCCESS(f'Updated the summary of {updated} post(s).'))
@@ -0,0 +1,33 @@
+"""Recompute the related posts of every published post.
+
+Posts are kept up to date incrementally when saved (see
+``blog/related.py``); run this after importing posts in bulk, or
+periodically to refresh the approximate incremental scores.
+
+Usage:
+    python manage.py rebuild_related_posts [--top N]
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog.related import rebuild_related_posts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the TF-IDF related posts index of all published posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=settings.BLOG_RELATED_POSTS,
+            help='Number of related posts stored per post.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        indexed = rebuild_related_posts(options['top'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {indexed} post(s) in {time.monotonic() - started:.2f}s.'
+        ))
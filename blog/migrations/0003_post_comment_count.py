@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_comment_counts(apps, schema_editor):
+    # Count the active comments of existing posts
+    Post = apps.get_model('blog', 'Post')
+    Comment = apps.get_model('blog', 'Comment')
+    active_comments = (
+        Comment.objects.filter(post=OuterRef('pk'), active=True)
+        .order_by().values('post').annotate(n=Count('pk')).values('n')
+    )
+    Post.objects.update(comment_count=Coalesce(Subquery(active_comments), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_post_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'active', 'created'], name='blog_commen_post_id_6ee5ee_idx'),
+        ),
+        migrations.RunPython(backfill_comment_counts, migrations.RunPython.noop),
+    ]
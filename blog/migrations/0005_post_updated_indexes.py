@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_relatedpost'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['published', 'updated'], name='blog_post_publish_972064_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['category', 'published', 'updated'], name='blog_post_categor_acde56_idx'),
+        ),
+    ]
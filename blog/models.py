@@ -5,6 +5,10 @@ This module defines the data models used by the blog application:
 - Category: a simple categorization model for posts.
 - Post: blog posts with content, excerpt, image and publication metadata.
 - Comment: comments left by visitors on posts.
+- RelatedPost: precomputed "related posts" of a post (see ``blog/related.py``).
+
+``Post.comment_count`` is a denormalized count of a post's active
+comments, kept in sync by the signal handlers in ``blog/signals.py``.
 
 Each model includes small helper methods (for example
 ``get_absolute_url``) and sensible Meta options (ordering, indexes)
@@ -12,10 +16,16 @@ to improve usability and query performance.
 """
 
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.urls import reverse #the reverse function is used to generate URLs based on view names and parameters
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+from core.models import LoadedValuesMixin  # lets signal handlers see the previously stored values
 
 
-class Category(models.Model):
+class Category(LoadedValuesMixin, models.Model):
     """Category for grouping blog posts.
 
     Fields
@@ -40,12 +50,13 @@ class Category(models.Model):
         return reverse('blog:post_list_by_category', args=[self.slug])
     #this method uses the reverse function to generate a URL for the category's post list page based on its slug
 
-class Post(models.Model):
+class Post(LoadedValuesMixin, models.Model):
     """Model representing a blog post.
 
     Key fields include title, slug (unique URL identifier), content,
     excerpt, image, timestamps, publication flag, and a foreign key to
-    Category.
+    Category. ``summary`` is derived from the excerpt/content on save and
+    ``comment_count`` mirrors the number of active comments.
     """
 
     title = models.CharField(max_length=200)
@@ -53,6 +64,9 @@ class Post(models.Model):
     content = models.TextField()
     # Short summary used in listings; limited to 300 chars here
     excerpt = models.TextField(max_length=300)
+    # Card text precomputed on save (the excerpt, or the first words of the
+    # content) so listings never need to load or parse the article body
+    summary = models.TextField(blank=True, editable=False)
     # Image uploaded to MEDIA_ROOT/blog/
     image = models.ImageField(upload_to='blog/')
     created = models.DateTimeField(auto_now_add=True)
@@ -62,17 +76,26 @@ class Post(models.Model):
     category = models.ForeignKey(
         Category, on_delete=models.CASCADE, related_name='posts'
     )
+    # Number of active comments, maintained by refresh_comment_counts() so
+    # pages can show it without counting the comments
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         # Order posts newest-first by default
         ordering = ['-created']
         # Indexes to speed up common queries (ordering by created and
-        # filtering by published + ordering by created)
+        # filtering by published + ordering by created); the updated ones
+        # give the feeds' latest change (blog/feeds.py) without a scan
         indexes = [
             models.Index(fields=['-created']),
             models.Index(fields=['-published', '-created']),
+            models.Index(fields=['published', 'updated']),
+            models.Index(fields=['category', 'published', 'updated']),
         ]
 
+    # Number of words of the content used as summary when there is no excerpt
+    SUMMARY_WORDS = 30
+
     def __str__(self):
         return self.title
 
@@ -80,8 +103,42 @@ class Post(models.Model):
         """Return the canonical URL for the post detail page."""
         return reverse('blog:post_detail', args=[self.slug])
 
-
-class Comment(models.Model):
+    def build_summary(self):
+        """Return the listing summary: the excerpt, or the start of the content.
+
+        Matches what the listing template used to compute on every
+        render (``content|striptags|truncatewords:30``).
+        """
+        if self.excerpt:
+            return self.excerpt
+        return Truncator(strip_tags(self.content)).words(self.SUMMARY_WORDS, truncate=' …')
+
+    @classmethod
+    def refresh_comment_counts(cls, post_ids):
+        """Recount the active comments of the given posts in one UPDATE.
+
+        Recounting (rather than adding or subtracting one) keeps the
+        counts correct whatever changed: new, moderated, moved or deleted
+        comments. The subquery walks the ``(post, active, created)`` index.
+        """
+        active_comments = (
+            Comment.objects.filter(post=OuterRef('pk'), active=True)
+            .order_by().values('post').annotate(n=Count('pk')).values('n')
+        )
+        cls.objects.filter(pk__in=post_ids).update(
+            comment_count=Coalesce(Subquery(active_comments), Value(0)),
+        )
+
+    def save(self, *args, **kwargs):
+        self.summary = self.build_summary()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'content', 'excerpt'} & set(update_fields):
+            # Keep the summary in sync on partial saves too
+            kwargs['update_fields'] = {*update_fields, 'summary'}
+        super().save(*args, **kwargs)
+
+
+class Comment(LoadedValuesMixin, models.Model):
     """Visitor comments attached to a Post.
 
     Fields
@@ -102,10 +159,37 @@ class Comment(models.Model):
     class Meta:
         # Order comments by creation time (oldest first)
         ordering = ['created']
-        # Index on created helps ordering and time-based queries
+        # Index on created helps ordering and time-based queries; the
+        # composite index serves "active comments of a post, in order"
+        # (comment pages and comment counts)
         indexes = [
             models.Index(fields=['created']),
+            models.Index(fields=['post', 'active', 'created']),
         ]
 
     def __str__(self):
         return f'Comment by {self.name} on {self.post}'
+
+
+class RelatedPost(models.Model):
+    """One of the most similar posts of a post, precomputed.
+
+    Rows are written by ``blog/related.py`` (never edited by hand);
+    ``rank`` orders a post's related posts, best first.
+    """
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    # Cosine similarity of the two posts' TF-IDF vectors
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['post', 'rank']
+        # Serves "related posts of a post, in rank order" with one index scan
+        indexes = [
+            models.Index(fields=['post', 'rank']),
+        ]
+
+    def __str__(self):
+        return f'{self.related} related to {self.post}'
@@ -0,0 +1,137 @@
+"""Keyset (cursor) pagination for blog posts and comments.
+
+``Paginator`` pages with ``OFFSET`` and needs a ``COUNT(*)`` to know the
+number of pages, so deep pages get slower and every page pays for the
+count. ``KeysetPaginator`` instead remembers where the previous page
+ended: the next page is the posts strictly older than the last post
+shown, ordered by ``(-created, -id)``. Combined with the
+``published = true`` filter this walks the existing
+``(-published, -created)`` index, so any page costs the same single
+``LIMIT`` query. The total is only counted when explicitly requested.
+
+Cursors are opaque URL-safe strings; invalid or tampered cursors
+simply yield the first page.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(direction, obj):
+    """Encode a position before (``'p'``) or after (``'n'``) ``obj``."""
+
+    data = json.dumps([direction, obj.created.isoformat(), obj.pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(direction, created, pk)`` for a cursor, or None if invalid."""
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, created, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if direction not in ('n', 'p'):
+            return None
+        return direction, datetime.fromisoformat(created), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    """One page of a keyset-paginated listing.
+
+    Mirrors the parts of Django's ``Page`` used by templates (iteration,
+    ``has_next``, ``has_previous``, ``has_other_pages``) and adds the
+    ``next_cursor``/``previous_cursor`` to link to neighbouring pages.
+    ``count`` is the total number of objects, or None when not requested.
+    """
+
+    is_keyset = True
+
+    def __init__(self, object_list, has_next, has_previous, count=None):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+        self.count = count
+        self.next_cursor = encode_cursor('n', object_list[-1]) if has_next else None
+        self.previous_cursor = encode_cursor('p', object_list[0]) if has_previous else None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+
+class KeysetPaginator:
+    """Paginate a queryset by ``(created, id)``, newest first by default.
+
+    With ``newest_first=False`` the objects are listed oldest first
+    (used for comments).
+    """
+
+    def __init__(self, queryset, per_page, newest_first=True):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.newest_first = newest_first
+
+    def _ordering(self, forward):
+        # Listing order when walking forward, the opposite order otherwise
+        if forward == self.newest_first:
+            return ('-created', '-pk')
+        return ('created', 'pk')
+
+    def _beyond(self, created, pk, forward):
+        # Objects following (forward) or preceding the cursor in listing order
+        if forward == self.newest_first:
+            return Q(created__lt=created) | Q(created=created, pk__lt=pk)
+        return Q(created__gt=created) | Q(created=created, pk__gt=pk)
+
+    def get_page(self, cursor=None, with_count=False):
+        """Return the ``KeysetPage`` for ``cursor`` (the first page if None/invalid).
+
+        If ``with_count`` is True, the total number of objects is also
+        computed (one extra ``COUNT`` query).
+        """
+
+        position = decode_cursor(cursor) if cursor else None
+        queryset = self.queryset
+
+        if position is None:
+            # First page
+            rows = list(queryset.order_by(*self._ordering(True))[:self.per_page + 1])
+            has_next, has_previous = len(rows) > self.per_page, False
+            rows = rows[:self.per_page]
+        else:
+            direction, created, pk = position
+            if direction == 'n':
+                # Objects after the cursor in listing order
+                rows = list(queryset.filter(self._beyond(created, pk, True))
+                            .order_by(*self._ordering(True))[:self.per_page + 1])
+                has_next, has_previous = len(rows) > self.per_page, True
+                rows = rows[:self.per_page]
+            else:
+                # Objects before the cursor, fetched in reverse then flipped back
+                rows = list(queryset.filter(self._beyond(created, pk, False))
+                            .order_by(*self._ordering(False))[:self.per_page + 1])
+                has_next, has_previous = True, len(rows) > self.per_page
+                rows = rows[:self.per_page][::-1]
+
+            if not rows:
+                # Stale cursor pointing past either end: start over
+                return self.get_page(None, with_count)
+
+        count = queryset.count() if with_count else None
+        return KeysetPage(rows, has_next, has_previous, count)
@@ -0,0 +1,330 @@
+"""Related posts computed from TF-IDF vectors.
+
+Every published post is turned into a TF-IDF vector of the words of its
+title, excerpt and content (title words weigh more than excerpt words,
+which weigh more than content words). Vectors are L2-normalized rows of
+a SciPy sparse matrix, so the cosine similarity of two posts is a dot
+product and the similarities of a batch of posts with all others is a
+single sparse matrix product.
+
+The ``BLOG_RELATED_POSTS`` most similar posts of each post are stored as
+``RelatedPost`` rows, so ``post_detail`` shows them with one indexed
+query. ``rebuild_related_posts()`` (the ``rebuild_related_posts``
+management command) recomputes everything; ``update_related_posts()``
+is run after a post is saved or deleted and only rewrites that post's
+neighbours and inserts it into (or removes it from) the lists of other
+posts.
+
+``update_related_posts()`` doesn't rebuild the matrix: each process
+keeps the one it last built and only vectorizes the saved post with the
+matrix's vocabulary and IDF, replacing the post's row. The matrix is
+tagged with the ``blog:related`` version of ``core.cache``, which every
+update bumps; a process seeing a version it didn't write (a change made
+by another process, or a rebuild) builds the matrix again from the
+database. Because document frequencies shift a little with every post,
+scores written incrementally are approximate until the next full
+rebuild. ``QuerySet.update()`` sends no signals: run the
+``rebuild_related_posts`` command after updating posts in bulk.
+"""
+
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from scipy import sparse
+
+from core.cache import bump_version, get_version
+
+from .models import Post, RelatedPost
+
+# Version of the related posts, part of the post detail page's ETag
+RELATED_VERSION = 'blog:related'
+
+# Relative weight of the words of each field
+FIELD_WEIGHTS = (('title', 3.0), ('excerpt', 2.0), ('content', 1.0))
+
+# Number of posts whose similarities are computed per matrix product,
+# bounding memory to CHUNK_SIZE x number of posts dense scores
+CHUNK_SIZE = 256
+
+# Posts less similar than this are never listed as related
+MIN_SCORE = 0.05
+
+_WORD_RE = re.compile(r'[^\W_]{2,}')
+_TAG_RE = re.compile(r'<[^>]*>')
+
+# Frequent English words that carry no topic
+STOP_WORDS = frozenset('''
+    about above after again all also am an and any are as at be because been before
+    being below between both but by can could did do does doing down during each few
+    for from further had has have having he her here hers him his how if in into is
+    it its just me more most my no nor not now of off on once only or other our ours
+    out over own same she should so some such than that the their theirs them then
+    there these they this those through to too under until up very was we were what
+    when where which while who whom why will with would you your yours
+'''.split())
+
+
+def tokenize(text):
+    """Return the lowercased, stop-word filtered words of ``text``."""
+
+    words = _WORD_RE.findall(_TAG_RE.sub(' ', text or '').lower())
+    return [word for word in words if word not in STOP_WORDS]
+
+
+def _weighted_terms(post):
+    # Term -> weighted count for one post
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for word in tokenize(post[field]):
+            terms[word] += weight
+    return terms
+
+
+class TfidfIndex:
+    """TF-IDF matrix of the published posts.
+
+    ``ids[i]`` is the post of row ``i`` of ``matrix`` (CSR, rows
+    L2-normalized). Term frequencies are dampened (``1 + log tf``) and
+    inverse document frequencies smoothed (``log((1 + n) / (1 + df)) + 1``).
+    ``put()`` and ``discard()`` change single rows, keeping the IDF.
+    """
+
+    def __init__(self, posts):
+        # The RELATED_VERSION the matrix is up to date with (see _current_index)
+        self.version = None
+        vocabulary = {}
+        indptr, indices, counts, ids = [0], [], [], []
+        for post in posts:
+            for term, count in _weighted_terms(post).items():
+                indices.append(vocabulary.setdefault(term, len(vocabulary)))
+                counts.append(count)
+            indptr.append(len(indices))
+            ids.append(post['id'])
+
+        self.ids = np.array(ids, dtype=np.int64)
+        self.vocabulary = vocabulary
+        matrix = sparse.csr_matrix(
+            (np.array(counts, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr)),
+            shape=(len(ids), len(vocabulary)),
+        )
+        matrix.data = 1.0 + np.log(matrix.data)
+
+        document_frequency = np.bincount(matrix.indices, minlength=len(vocabulary))
+        self.idf = np.log((1.0 + len(ids)) / (1.0 + document_frequency)) + 1.0
+        matrix = matrix @ sparse.diags(self.idf)
+
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        self.matrix = sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix)
+
+    @classmethod
+    def from_database(cls):
+        """Build the index of all published posts (one query)."""
+
+        posts = (
+            Post.objects.filter(published=True).order_by('pk')
+            .values('id', 'title', 'excerpt', 'content').iterator(chunk_size=500)
+        )
+        return cls(posts)
+
+    def row(self, post_id):
+        """Return the row number of ``post_id``, or None if not indexed."""
+
+        found = np.flatnonzero(self.ids == post_id)
+        return int(found[0]) if len(found) else None
+
+    def _vector(self, post):
+        # L2-normalized row of ``post`` weighted with the current IDF; words
+        # new to the vocabulary get the IDF of a word used by one post
+        terms = _weighted_terms(post)
+        for term in terms:
+            self.vocabulary.setdefault(term, len(self.vocabulary))
+        added = len(self.vocabulary) - len(self.idf)
+        if added:
+            new_idf = np.log((1.0 + len(self.ids)) / 2.0) + 1.0
+            self.idf = np.concatenate([self.idf, np.full(added, new_idf)])
+            self.matrix.resize((len(self.ids), len(self.vocabulary)))
+
+        columns = np.array([self.vocabulary[term] for term in terms], dtype=np.int64)
+        values = (1.0 + np.log(np.array(list(terms.values()), dtype=np.float64))) * self.idf[columns]
+        norm = np.sqrt(values @ values) or 1.0
+        return sparse.csr_matrix(
+            (values / norm, columns, np.array([0, len(columns)])), shape=(1, len(self.vocabulary)),
+        )
+
+    def put(self, post):
+        """Add or replace the row of ``post`` (a dict like ``from_database`` reads)."""
+
+        self.discard(post['id'])
+        self.matrix = sparse.vstack([self.matrix, self._vector(post)], format='csr')
+        self.ids = np.append(self.ids, np.int64(post['id']))
+
+    def discard(self, post_id):
+        """Remove the row of ``post_id`` if it has one."""
+
+        row = self.row(post_id)
+        if row is not None:
+            keep = np.ones(len(self.ids), dtype=bool)
+            keep[row] = False
+            self.matrix = self.matrix[keep]
+            self.ids = self.ids[keep]
+
+    def similarities(self, rows):
+        """Dense ``len(rows) x n`` cosine similarities of ``rows`` with every post."""
+
+        scores = (self.matrix[rows] @ self.matrix.T).toarray()
+        # A post is not related to itself
+        scores[np.arange(len(rows)), rows] = 0.0
+        return scores
+
+
+def top_neighbours(scores, k):
+    """Return ``[(column, score), ...]`` of the ``k`` best scores, best first."""
+
+    if k <= 0 or not len(scores):
+        return []
+    k = min(k, len(scores))
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return [(int(column), float(scores[column])) for column in candidates if scores[column] >= MIN_SCORE]
+
+
+def _rows_for(post_id, neighbours, ids):
+    return [
+        RelatedPost(post_id=post_id, related_id=int(ids[column]), score=score, rank=rank)
+        for rank, (column, score) in enumerate(neighbours)
+    ]
+
+
+def rebuild_related_posts(k=None):
+    """Recompute the related posts of every published post.
+
+    Returns the number of posts indexed.
+    """
+
+    k = k or settings.BLOG_RELATED_POSTS
+    index = TfidfIndex.from_database()
+    related = []
+    for start in range(0, len(index.ids), CHUNK_SIZE):
+        rows = np.arange(start, min(start + CHUNK_SIZE, len(index.ids)))
+        for offset, scores in enumerate(index.similarities(rows)):
+            related.extend(_rows_for(int(index.ids[start + offset]), top_neighbours(scores, k), index.ids))
+
+    with transaction.atomic():
+        RelatedPost.objects.all().delete()
+        RelatedPost.objects.bulk_create(related, batch_size=500)
+    bump_version(RELATED_VERSION)
+    return len(index.ids)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _current_index():
+    # This process's matrix (called with _index_lock held), built from the
+    # database when missing or changed by another process
+    global _index
+    version = get_version(RELATED_VERSION)
+    if _index is None or _index.version != version:
+        _index = TfidfIndex.from_database()
+        _index.version = version
+    return _index
+
+
+def update_related_posts(post_id, k=None):
+    """Refresh the related posts after ``post_id`` was saved or deleted.
+
+    Rewrites the post's own neighbours, then adds it to the lists of
+    posts it is now more similar to than their last neighbour, and
+    drops it from lists where it no longer belongs (e.g. unpublished).
+    Only the post is read and vectorized (see the module docstring).
+    """
+
+    global _index
+    k = k or settings.BLOG_RELATED_POSTS
+    try:
+        _update_related_posts(post_id, k)
+    except IntegrityError:
+        # The matrix lists posts removed without signals (raw deletes,
+        # flush...): build it again from the database and retry
+        with _index_lock:
+            _index = None
+        _update_related_posts(post_id, k)
+
+
+def _update_related_posts(post_id, k):
+    post = Post.objects.filter(pk=post_id).values('id', 'title', 'excerpt', 'content', 'published').first()
+    with _index_lock:
+        index = _current_index()
+        if post is not None and post['published']:
+            index.put(post)
+        else:
+            index.discard(post_id)
+        row = index.row(post_id)
+        scores = None if row is None else index.similarities(np.array([row]))[0]
+        ids, version = index.ids, index.version
+
+    with transaction.atomic():
+        # Drop the post's own list and its entries in other lists; the
+        # entries are added back below where the post still belongs
+        RelatedPost.objects.filter(related_id=post_id).delete()
+        RelatedPost.objects.filter(post_id=post_id).delete()
+        if scores is not None:
+            RelatedPost.objects.bulk_create(_rows_for(post_id, top_neighbours(scores, k), ids))
+            _insert_into_other_lists(post_id, scores, ids, k)
+        # Lists the post was removed from keep a gap in their ranks, which
+        # only order the rows; the next full rebuild fills them up again
+
+    new_version = bump_version(RELATED_VERSION)
+    with _index_lock:
+        # The matrix stays current unless another process changed posts in
+        # between (it is then rebuilt by the next update)
+        if index is _index and index.version == version and new_version == version + 1:
+            index.version = new_version
+
+
+def _insert_into_other_lists(post_id, scores, ids, k):
+    # The post's similarity to another post is symmetric: add it to the
+    # lists of the posts where it now ranks among the k best
+    candidates = {int(ids[column]): float(scores[column])
+                  for column in np.flatnonzero(scores >= MIN_SCORE)}
+    if not candidates:
+        return
+    lists = {}
+    for entry in RelatedPost.objects.filter(post_id__in=candidates).order_by('post_id', 'rank'):
+        lists.setdefault(entry.post_id, []).append(entry)
+
+    changed = []
+    for other_id, score in candidates.items():
+        entries = lists.get(other_id, [])
+        if len(entries) >= k and entries[-1].score >= score:
+            continue
+        merged = sorted(
+            [(entry.related_id, entry.score) for entry in entries] + [(post_id, score)],
+            key=lambda item: -item[1],
+        )[:k]
+        changed.append((other_id, merged))
+
+    if changed:
+        RelatedPost.objects.filter(post_id__in=[other_id for other_id, _ in changed]).delete()
+        RelatedPost.objects.bulk_create([
+            RelatedPost(post_id=other_id, related_id=related_id, score=score, rank=rank)
+            for other_id, merged in changed
+            for rank, (related_id, score) in enumerate(merged)
+        ])
+
+
+def schedule_related_update(post_id):
+    """Refresh the related posts of ``post_id`` once the transaction commits.
+
+    Also used when a published post is deleted, to drop it from this
+    process's matrix.
+    """
+
+    transaction.on_commit(lambda: update_related_posts(post_id))
+
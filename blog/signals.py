@@ -0,0 +1,107 @@
+"""Signal handlers for the blog app.
+
+Connected in ``BlogConfig.ready()``. They keep the cached listing
+fragments (see ``blog/caching.py``), the denormalized
+``Post.comment_count``, the related posts (see ``blog/related.py``) and
+the search documents of a post's comments in sync with the database.
+"""
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.search.fts import index_objects
+
+from .caching import invalidate_listings, invalidate_categories, invalidate_category_nav
+from .models import Category, Comment, Post
+from .related import schedule_related_update
+
+# Post fields the related posts are computed from
+RELATED_FIELDS = ('title', 'excerpt', 'content', 'published')
+
+
+def _category_slugs(category_ids):
+    return set(Category.objects.filter(id__in=category_ids).values_list('slug', flat=True))
+
+
+def update_comment_counts(post_ids):
+    """Recount the posts' comments and invalidate the listings showing them.
+
+    Also called after comments are inserted without signals (see
+    ``blog/ingestion.py``).
+    """
+
+    Post.refresh_comment_counts(post_ids)
+    slugs = set(
+        Post.objects.filter(id__in=post_ids, published=True)
+        .values_list('category__slug', flat=True)
+    )
+    if slugs:
+        invalidate_listings(slugs)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created=False, **kwargs):
+    """Invalidate the listings a saved post appears (or appeared) in."""
+
+    loaded = instance.get_loaded_values()
+    was_published = loaded.get('published', False)
+    if instance.published or was_published:
+        # A draft that stays a draft is not visible in any listing
+        invalidate_listings(_category_slugs({instance.category_id, loaded.get('category_id')}))
+    if was_published != instance.published or (
+        instance.published and loaded.get('category_id', instance.category_id) != instance.category_id
+    ):
+        # Published post counts of the category navigation changed
+        invalidate_category_nav()
+    if was_published != instance.published and not created:
+        # Comments are searchable only on published posts: index or drop
+        # the post's active comments (the reverse relation sets their post)
+        index_objects(list(instance.comments.filter(active=True)))
+    if (instance.published or was_published) and any(
+        loaded.get(field) != getattr(instance, field) for field in RELATED_FIELDS
+    ):
+        schedule_related_update(instance.pk)
+    instance.remember_loaded_values()
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    """Invalidate the listings and related posts a deleted post appeared in."""
+
+    if instance.get_loaded_values().get('published', instance.published):
+        invalidate_listings(_category_slugs({instance.category_id}))
+        invalidate_category_nav()
+        schedule_related_update(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    """Invalidate the category navigation and the listing pages of the category."""
+
+    slugs = {instance.slug, instance.get_loaded_values().get('slug')}
+    invalidate_categories(slugs - {None})
+    instance.remember_loaded_values()
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    """Update the comment count when a comment is added, moderated or moved."""
+
+    loaded = instance.get_loaded_values()
+    was_active = loaded.get('active', False)
+    old_post_id = loaded.get('post_id', instance.post_id)
+    if (created and instance.active) or was_active != instance.active or old_post_id != instance.post_id:
+        update_comment_counts({instance.post_id, old_post_id})
+    instance.remember_loaded_values()
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, origin=None, **kwargs):
+    """Update the comment count when an active comment is deleted."""
+
+    if isinstance(origin, Post):
+        # Cascade from deleting the post itself: nothing left to count
+        return
+    if instance.get_loaded_values().get('active', instance.active):
+        update_comment_counts({instance.post_id})
@@ -0,0 +1,20 @@
+"""Template tags for the blog app.
+
+``{% category_nav %}`` renders the category badges (with published post
+counts) from the cached navigation data of ``blog.caching``, so any page
+can show the categories without querying them. Load with
+``{% load blog_tags %}``.
+"""
+
+from django import template
+
+from ..caching import get_category_nav
+
+register = template.Library()
+
+
+@register.inclusion_tag('blog/includes/category_bar.html')
+def category_nav(current=None):
+    """Render the category navigation, highlighting the ``current`` slug."""
+
+    return {'categories': get_category_nav(), 'current': current}
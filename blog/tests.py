@@ -1,3 +1,241 @@
-from django.test import TestCase
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from core.cache import get_version
+from core.search import KINDS_BY_NAME
+from core.search.fts import count
+
+from . import related
+from .caching import ALL_POSTS_VERSION, CATEGORIES_VERSION, listing_version_name
+from .ingestion import CommentBuffer
+from .models import Category, Comment, Post, RelatedPost
+
+
+class CommentBufferSpoolTests(TransactionTestCase):
+    """Buffers of several processes sharing the spool directory."""
+
+    def setUp(self):
+        category = Category.objects.create(name='News', slug='news')
+        self.post = Post.objects.create(
+            title='Opening', slug='opening', content='We are open.', excerpt='Open',
+            image='blog/test.jpg', published=True, category=category,
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool_path = os.path.join(directory.name, 'comments.jsonl')
+
+    def make_buffer(self, worker):
+        # A long flush interval: comments are only inserted by flush()/stop()
+        buffer = CommentBuffer(self.spool_path, flush_interval=60, worker=worker)
+        self.addCleanup(buffer.stop)
+        return buffer
+
+    def submit(self, buffer, content):
+        buffer.submit(Comment(post=self.post, name='Ann', email='ann@example.com', content=content))
+
+    def crash(self, buffer):
+        # Stop the flusher, forget the pending comments and release the lock
+        # without inserting anything
+        with buffer._changed:
+            buffer._stopping = True
+            buffer._changed.notify_all()
+        buffer._thread.join()
+        buffer._pending.clear()
+        buffer._lock_file.close()
+
+    def test_live_buffers_keep_their_own_spool(self):
+        first = self.make_buffer('first')
+        self.submit(first, 'Hello')
+        second = self.make_buffer('second')
+        self.submit(second, 'Hi')
+
+        # The second buffer neither took over nor rewrote the first's comments
+        self.assertEqual(first.stats()['pending'], 1)
+        self.assertEqual(second.stats()['pending'], 1)
+        self.assertEqual(len(first._read_spool(first.spool_path)), 1)
+
+        second.flush()
+        first.flush()
+        self.assertEqual(sorted(Comment.objects.values_list('content', flat=True)), ['Hello', 'Hi'])
+
+    def test_dead_buffer_spool_is_recovered_once(self):
+        dead = self.make_buffer('dead')
+        self.submit(dead, 'Hello')
+        self.crash(dead)
+
+        recovering = self.make_buffer('recovering')
+        other = self.make_buffer('other')
+        self.assertEqual(recovering.stats()['pending'], 1)
+        self.assertEqual(other.stats()['pending'], 0)
+        self.assertFalse(os.path.exists(dead.spool_path))
+
+        recovering.flush()
+        self.assertEqual(list(Comment.objects.values_list('content', flat=True)), ['Hello'])
+
+
+class CommentBufferFailureTests(TransactionTestCase):
+    """Comments that can't be inserted don't hold up the others."""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='News', slug='news')
+        self.post = self.create_post('opening')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.buffer = CommentBuffer(os.path.join(directory.name, 'comments.jsonl'), flush_interval=60)
+        self.addCleanup(self.buffer.stop)
+
+    def create_post(self, slug):
+        return Post.objects.create(
+            title=slug, slug=slug, content='Text', excerpt='Text',
+            image='blog/test.jpg', published=True, category=self.category,
+        )
+
+    def submit(self, post, content):
+        self.buffer.submit(Comment(post=post, name='Ann', email='ann@example.com', content=content))
+
+    def test_comment_on_deleted_post_is_dropped(self):
+        closed = self.create_post('closed')
+        self.submit(closed, 'Too late')
+        self.submit(self.post, 'Hello')
+        closed.delete()
+
+        with self.assertLogs('blog.ingestion', 'WARNING'):
+            self.buffer.flush()
+        self.assertEqual(list(Comment.objects.values_list('content', flat=True)), ['Hello'])
+        stats = self.buffer.stats()
+        self.assertEqual((stats['pending'], stats['flushed'], stats['dropped']), (0, 1, 1))
+        self.assertEqual(self.buffer._read_spool(self.buffer.spool_path), [])
+
+    def test_failing_comment_is_dropped(self):
+        self.submit(self.post, 'Hello')
+        # NOT NULL violation: the batch fails, then only this comment does
+        self.submit(self.post, None)
+        self.submit(self.post, 'Hi')
+
+        with self.assertLogs('blog.ingestion', 'ERROR') as logs:
+            self.buffer.flush()
+        self.assertIn('Dropping a buffered comment that cannot be inserted', logs.output[-1])
+        self.assertEqual(sorted(Comment.objects.values_list('content', flat=True)), ['Hello', 'Hi'])
+        stats = self.buffer.stats()
+        self.assertEqual((stats['pending'], stats['flushed'], stats['dropped'], stats['failed_flushes']), (0, 2, 1, 1))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+
+
+class ListingCacheTests(TestCase):
+    """Cached listings are invalidated once post changes commit."""
+
+    def test_versions_bumped_on_commit(self):
+        category = Category.objects.create(name='News', slug='news')
+        names = [ALL_POSTS_VERSION, listing_version_name('news'), CATEGORIES_VERSION]
+        versions = [get_version(name) for name in names]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(
+                title='Opening', slug='opening', content='We are open.', excerpt='Open',
+                image='blog/test.jpg', published=True, category=category,
+            )
+            # A page rendered before the commit would show the old posts
+            self.assertEqual([get_version(name) for name in names], versions)
+        for name, version in zip(names, versions):
+            self.assertGreater(get_version(name), version)
+
+
+class FeedTests(TestCase):
+    """Feeds answer 304 only while their posts are unchanged."""
+
+    def test_unpublishing_changes_the_feed(self):
+        category = Category.objects.create(name='News', slug='news')
+        posts = [
+            Post.objects.create(
+                title=f'Post {number}', slug=f'post-{number}', content='Text', excerpt='Text',
+                image='blog/test.jpg', published=True, category=category,
+            )
+            for number in range(2)
+        ]
+        url = reverse('blog:feed_rss')
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        posts[0].published = False
+        posts[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Post 0', b''.join(response.streaming_content).decode())
+
+
+class CommentSearchTests(TestCase):
+    """Comments are searchable only while their post is published."""
+
+    def test_publishing_indexes_the_comments(self):
+        category = Category.objects.create(name='News', slug='news')
+        post = Post.objects.create(
+            title='Opening', slug='opening', content='We are open.', excerpt='Open',
+            image='blog/test.jpg', category=category,
+        )
+        Comment.objects.create(post=post, name='Ann', email='ann@example.com', content='Lovely flatwhite')
+        Comment.objects.create(post=post, name='Bob', email='bob@example.com', content='Flatwhite again', active=False)
+        comments = KINDS_BY_NAME['comment']
+        self.assertEqual(count('flatwhite', comments, 10), 0)
+
+        post = Post.objects.get(pk=post.pk)
+        post.published = True
+        post.save()
+        self.assertEqual(count('flatwhite', comments, 10), 1)
+
+        post.published = False
+        post.save()
+        self.assertEqual(count('flatwhite', comments, 10), 0)
+
+
+class RelatedPostsTests(TestCase):
+    """Saving a post updates the related posts without rebuilding the matrix."""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Coffee', slug='coffee')
+        # The matrix would otherwise keep the posts this test rolls back
+        related._index = None
+        self.addCleanup(setattr, related, '_index', None)
+
+    def create(self, slug, title, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(
+                title=title, slug=slug, content=content, excerpt='', image='blog/test.jpg',
+                published=True, category=self.category,
+            )
+
+    def related_slugs(self, post):
+        return list(RelatedPost.objects.filter(post=post).order_by('rank').values_list('related__slug', flat=True))
+
+    def test_incremental_updates(self):
+        espresso = self.create('espresso', 'Espresso brewing', 'espresso crema grind pressure')
+        croissant = self.create('croissant', 'Croissant baking', 'butter flour dough oven')
+        with mock.patch.object(related.TfidfIndex, 'from_database', wraps=related.TfidfIndex.from_database) as build:
+            machines = self.create('machines', 'Espresso machines', 'espresso machine pressure boiler')
+            bread = self.create('bread', 'Baking bread', 'flour dough oven yeast')
+            self.assertEqual(self.related_slugs(espresso), ['machines'])
+            self.assertEqual(self.related_slugs(bread), ['croissant'])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                croissant.title = 'Espresso crema'
+                croissant.content = 'espresso pressure crema'
+                croissant.save()
+            self.assertEqual(self.related_slugs(croissant), ['espresso', 'machines'])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                machines.delete()
+            self.assertEqual(self.related_slugs(espresso), ['croissant'])
+        build.assert_not_called()
+
+    def test_change_by_another_process_rebuilds(self):
+        self.create('espresso', 'Espresso brewing', 'espresso crema grind pressure')
+        related.bump_version(related.RELATED_VERSION)
+        with mock.patch.object(related.TfidfIndex, 'from_database', wraps=related.TfidfIndex.from_database) as build:
+            self.create('machines', 'Espresso machines', 'espresso machine pressure boiler')
+        build.assert_called_once()
@@ -7,6 +7,7 @@ namespace via ``app_name`` so reverse lookups can be performed as
 
 from django.urls import path
 from . import views
+from .feeds import AtomCategoryFeed, AtomLatestPostsFeed, CategoryFeed, LatestPostsFeed, serve_feed
 
 # Application namespace for URL reversing (used in templates and code)
 app_name = 'blog'
@@ -19,6 +20,19 @@ urlpatterns = [
     # List view filtered by category slug (e.g. /category/coffee/)
     path('category/<slug:category_slug>/', views.post_list, name='post_list_by_category'),
 
+    # RSS/Atom feeds of the latest posts, for the whole blog and per category
+    path('feed/rss/', serve_feed(LatestPostsFeed), name='feed_rss'),
+    path('feed/atom/', serve_feed(AtomLatestPostsFeed), name='feed_atom'),
+    path('category/<slug:category_slug>/feed/rss/', serve_feed(CategoryFeed), name='category_feed_rss'),
+    path('category/<slug:category_slug>/feed/atom/', serve_feed(AtomCategoryFeed), name='category_feed_atom'),
+
+    # Buffered comment ingestion statistics (staff only); must precede the
+    # post slug pattern below, which would otherwise match it
+    path('comment-ingestion/', views.comment_ingestion_stats, name='comment_ingestion_stats'),
+
     # Detail view for a single post identified by its slug
     path('<slug:slug>/', views.post_detail, name='post_detail'),
+
+    # Further pages of a post's comments as JSON ("load more comments")
+    path('<slug:slug>/comments/', views.comment_list, name='comment_list'),
 ]
@@ -1,49 +1,149 @@
 """Views for the blog application with per-line explanations.
 
-This module contains two view functions: `post_list` which shows a
-paginated list of published posts (optionally filtered by category), and
-`post_detail` which displays a single post with its comments and a form to
-submit new comments.
+This module contains the blog view functions: `post_list` which shows a
+paginated list of published posts (optionally filtered by category)
+from cached fragments when possible, `post_detail` which displays a
+single post with the first page of its comments and a form to submit
+new comments, `comment_list` which returns further pages of comments
+as JSON for the "load more" button, and `comment_ingestion_stats`
+which reports on the buffered comment ingestion.
 """
 
+from django.conf import settings  # Project settings (pagination mode).
+from django.db.models import Max, Q  # Latest comment change for the detail page validator.
+from django.contrib.admin.views.decorators import staff_member_required  # Restricts the ingestion stats to staff.
+from django.http import JsonResponse  # JSON responses for the comment pages endpoint.
 from django.shortcuts import render, get_object_or_404  # Helpers for rendering templates and fetching objects or returning 404.
 from django.core.paginator import Paginator  # Paginator utility for splitting querysets into pages.
-from .models import Post, Category, Comment  # Import local models used by the views.
+from django.template.loader import render_to_string  # Renders the cached listing fragments.
+from django.utils import dateformat, timezone  # Formats comment dates for the JSON endpoint.
+from .models import Post, Category, Comment, RelatedPost  # Import local models used by the views.
 from .forms import CommentForm  # Import the form used to submit comments.
+from .caching import (  # Listing fragment cache and its version counters.
+    CATEGORIES_VERSION, get_or_render, grid_cache_key, listing_version_name,
+)
+from core.cache import get_version  # Version counters used as conditional GET validators.
+from core.conditional import conditional_page  # ETag / 304 support.
+from .pagination import KeysetPaginator, decode_cursor  # Cursor-based pagination.
+from .related import RELATED_VERSION  # Version of the precomputed related posts.
+from .ingestion import BufferFull, buffering_enabled, get_comment_buffer  # Write-behind comment ingestion.
 
 
+# Post fields needed to render a listing card
+LISTING_FIELDS = ('title', 'slug', 'image', 'created', 'summary', 'comment_count')
+
+# Number of comments shown per page on the detail page and per "load more"
+COMMENTS_PER_PAGE = 20
+
+
+def _comment_page(post_id, cursor=None):
+    """Return a page of a post's active comments, oldest first.
+
+    Cursor pagination over the ``(post, active, created)`` index: each
+    page is one ``LIMIT`` query however far down the thread it is.
+    """
+    comments = Comment.objects.filter(post_id=post_id, active=True).only(
+        'name', 'content', 'created',
+    )
+    return KeysetPaginator(comments, COMMENTS_PER_PAGE, newest_first=False).get_page(cursor)
+
+
+def _render_post_grid(category_slug, get_page):
+    """Run the listing queries and render the post grid fragment.
+
+    ``get_page`` receives the filtered queryset of posts and returns the
+    page object to render (a Django ``Page`` or a ``KeysetPage``).
+
+    Returns a ``(category, html)`` tuple where ``category`` is a small
+    dict with the category's name and slug (or None), so a cached grid
+    can be shown without querying the category again.
+    """
+    category = None  # Initialize category variable when no slug provided.
+    # Start with only published posts, loading just the fields shown on the
+    # cards (never the article bodies).
+    posts = Post.objects.filter(published=True).only(*LISTING_FIELDS)
+
+    if category_slug:
+        # If a category slug is provided, resolve it or return 404.
+        category_obj = get_object_or_404(Category, slug=category_slug)
+        posts = posts.filter(category=category_obj)  # Narrow posts to the chosen category.
+        category = {'name': category_obj.name, 'slug': category_obj.slug}
+
+    page_obj = get_page(posts)  # Get the page object for rendering.
+    return category, render_to_string('blog/includes/post_grid.html', {'page_obj': page_obj})
+
+
+def _post_list_version(request, category_slug=None):
+    # Same versions as the cached data: the listing and the category navigation
+    return get_version(listing_version_name(category_slug)), get_version(CATEGORIES_VERSION)
+
+
+def _post_detail_version(request, slug):
+    # One small query: the post's change time and comment count, and the
+    # latest change to its visible comments (None for a missing post)
+    row = (
+        Post.objects.filter(slug=slug, published=True)
+        .annotate(last_comment=Max('comments__updated', filter=Q(comments__active=True)))
+        .values_list('updated', 'comment_count', 'last_comment')
+        .first()
+    )
+    if row is None:
+        return None
+    # The category name and the related posts are shown too
+    return (*row, get_version(CATEGORIES_VERSION), get_version(RELATED_VERSION))
+
+
+@conditional_page(_post_list_version)
 def post_list(request, category_slug=None):
     """Render a paginated list of published posts, optionally filtered.
 
+    The post grid is rendered once and cached and the category
+    navigation comes from cached data (see ``blog/caching.py``); on a
+    cache hit no listing query runs. If
+    the client's copy is still current (same listing versions, see
+    ``core/conditional.py``) a 304 is returned without rendering.
+
+    With ``BLOG_PAGINATION = 'keyset'`` pages are addressed by an opaque
+    ``?cursor=`` instead of ``?page=N`` (see ``blog/pagination.py``):
+    every page costs one indexed query and the total number of posts is
+    only counted when ``?count=1`` is given.
+
     Args:
         request: HttpRequest object provided by Django.
         category_slug: Optional slug to filter posts by category.
 
     Returns:
         HttpResponse rendering the 'blog/post_list.html' template with
-        context variables for the category, list of categories, and the page
-        object containing posts for the current page.
+        context variables for the category and the rendered post grid
+        fragment.
     """
-    category = None  # Initialize category variable when no slug provided.
-    categories = Category.objects.all()  # Fetch all categories for sidebar/navigation.
-    posts = Post.objects.filter(published=True)  # Start with only published posts.
-
-    if category_slug:
-        # If a category slug is provided, resolve it or return 404.
-        category = get_object_or_404(Category, slug=category_slug)
-        posts = posts.filter(category=category)  # Narrow posts to the chosen category.
+    if settings.BLOG_PAGINATION == 'keyset':
+        cursor = request.GET.get('cursor', '')  # Read the opaque cursor from query params.
+        # Invalid cursors share the first page's cache entry
+        if cursor and decode_cursor(cursor) is None:
+            cursor = ''
+        with_count = request.GET.get('count') == '1'  # Only count the posts when asked to.
+        page_key = f'c{cursor}:{int(with_count)}'
+        get_page = lambda posts: KeysetPaginator(posts, 6).get_page(cursor, with_count)  # 6 posts per page.
+    else:
+        page_number = request.GET.get('page', '')  # Read current page number from query params.
+        # Normalize the page number so junk values share the first page's cache entry
+        page_number = int(page_number) if page_number.isdigit() else 1
+        page_key = page_number
+        get_page = lambda posts: Paginator(posts, 6).get_page(page_number)  # Paginate the posts: 6 posts per page.
 
-    paginator = Paginator(posts, 6)  # Paginate the posts: 6 posts per page.
-    page_number = request.GET.get('page')  # Read current page number from query params.
-    page_obj = paginator.get_page(page_number)  # Get the page object for rendering.
+    category, post_grid = get_or_render(
+        grid_cache_key(category_slug, page_key),
+        lambda: _render_post_grid(category_slug, get_page),
+    )
 
     return render(request, 'blog/post_list.html', {
         'category': category,  # The currently selected category (or None).
-        'categories': categories,  # All categories for the template.
-        'page_obj': page_obj,  # Page object with posts for the template.
+        'post_grid': post_grid,  # Rendered posts and pagination for the current page.
     })
 
 
+@conditional_page(_post_detail_version)
 def post_detail(request, slug):
     """Render a detail view for a single published post and handle comments.
 
@@ -51,14 +151,32 @@ def post_detail(request, slug):
         request: HttpRequest object.
         slug: Slug of the post to display.
 
+    Only one page of active comments is rendered; ``?comments=<cursor>``
+    selects another page (the "load more" link without JavaScript) and
+    ``comment_list`` serves the following pages as JSON. The total comes
+    from ``post.comment_count`` instead of counting the comments.
+
+    With ``BLOG_COMMENT_INGESTION = 'buffered'`` a valid comment is queued
+    (see ``blog/ingestion.py``) and shows up once the background flusher
+    has inserted it; when the buffer stays full the visitor is asked to
+    try again (HTTP 503).
+
+    The post's related posts are read from the precomputed
+    ``RelatedPost`` table.
+
+    GET requests for an unchanged post (same ``updated``, comment count
+    and latest comment change) are answered with 304.
+
     Returns:
         HttpResponse rendering the 'blog/post_detail.html' template with
-        the post, its active comments, a new_comment placeholder, and the
-        comment_form instance.
+        the post, a page of its active comments, a new_comment
+        placeholder, and the comment_form instance.
     """
-    post = get_object_or_404(Post, slug=slug, published=True)  # Fetch the post or 404.
-    comments = post.comments.filter(active=True)  # Only include active (approved) comments.
+    # Fetch the post (with its category, shown on the page) or 404.
+    post = get_object_or_404(Post.objects.select_related('category'), slug=slug, published=True)
     new_comment = None  # Placeholder for a newly created comment instance.
+    comment_queued = False  # Whether the new comment was buffered rather than inserted.
+    status = 200  # 503 when the comment buffer is full.
 
     if request.method == 'POST':
         # If the request is a POST, the user submitted the comment form.
@@ -67,13 +185,75 @@ def post_detail(request, slug):
             # Save the form but don't commit to add the post relationship.
             new_comment = comment_form.save(commit=False)
             new_comment.post = post  # Associate the new comment with the current post.
-            new_comment.save()  # Persist the new comment to the database.
+            if buffering_enabled():
+                try:
+                    get_comment_buffer().submit(new_comment)  # Inserted later in a batch.
+                    comment_queued = True
+                except BufferFull:
+                    # Backpressure: keep the form filled in and ask to retry.
+                    comment_form.add_error(None, 'We are receiving a lot of comments right now. Please try again in a moment.')
+                    new_comment = None
+                    status = 503
+            else:
+                new_comment.save()  # Persist the new comment to the database.
+                post.refresh_from_db(fields=['comment_count'])  # Pick up the count updated by the signal.
     else:
         comment_form = CommentForm()  # Empty form for GET requests.
 
+    comments = _comment_page(post.id, request.GET.get('comments'))  # One page of active comments.
+    # Precomputed related posts (see blog/related.py): one indexed query.
+    related_posts = [
+        entry.related for entry in
+        RelatedPost.objects.filter(post=post, related__published=True)
+        .select_related('related').only(*(f'related__{field}' for field in LISTING_FIELDS), 'post', 'related')
+        .order_by('rank')
+    ]
+
     return render(request, 'blog/post_detail.html', {
         'post': post,  # The post being viewed.
-        'comments': comments,  # Active comments to display.
+        'comments': comments,  # Page of active comments to display.
+        'related_posts': related_posts,  # Most similar published posts.
         'new_comment': new_comment,  # Newly created comment or None.
+        'comment_queued': comment_queued,  # Whether the comment will appear after the next flush.
         'comment_form': comment_form,  # Form to submit comments in the template.
-    })
\ No newline at end of file
+    }, status=status)
+
+
+def comment_list(request, slug):
+    """Return a page of a published post's active comments as JSON.
+
+    ``?cursor=`` is the ``next_cursor`` of the previous page (the first
+    page is returned without it). Used by the "load more comments"
+    button on the detail page.
+
+    Returns:
+        JsonResponse with ``comments`` (name, content, ISO and display
+        dates) and ``next_cursor`` (None on the last page).
+    """
+    post_id = get_object_or_404(Post.objects.only('id'), slug=slug, published=True).id  # 404 for unknown or draft posts.
+    page = _comment_page(post_id, request.GET.get('cursor'))
+    return JsonResponse({
+        'comments': [
+            {
+                'name': comment.name,
+                'content': comment.content,
+                'created': comment.created.isoformat(),
+                # Same format as the template ("M d, Y H:i") in the site's time zone
+                'created_display': dateformat.format(timezone.localtime(comment.created), 'M d, Y H:i'),
+            }
+            for comment in page
+        ],
+        'next_cursor': page.next_cursor,
+    })
+
+
+@staff_member_required
+def comment_ingestion_stats(request):
+    """Return this process's comment buffer statistics as JSON (staff only).
+
+    Reports the mode, queue depth, counters and recent batch sizes and
+    flush latencies (see ``CommentBuffer.stats``).
+    """
+    if not buffering_enabled():
+        return JsonResponse({'mode': 'sync'})
+    return JsonResponse({'mode': 'buffered', **get_comment_buffer().stats()})
@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'cart.middleware.CartCookieMiddleware',  # Writes the signed cart cookie when CART_STORAGE = 'cookie'.
 ]
 # MIDDLEWARE is an ordered list of middleware classes executed per request.
 
@@ -95,6 +96,40 @@ DATABASES = {
 # DATABASES configures the project's database connections.
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        # Local-memory cache is per process. When running several worker
+        # processes, use a shared backend (e.g. Redis or Memcached) so the
+        # version counters in core/cache.py are seen by every worker.
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# CACHES configures the cache used for the catalog snapshot version and other cached data.
+
+BLOG_CACHE_TIMEOUT = 60 * 60  # Seconds rendered blog listing fragments stay cached (they are also invalidated on change).
+BLOG_PAGINATION = 'keyset'  # Blog listing pagination: 'keyset' (cursor links, no COUNT) or 'page' (numbered pages).
+BLOG_RELATED_POSTS = 4  # Number of related posts precomputed and shown per post (see blog/related.py).
+
+# Comment ingestion: 'sync' inserts each comment in its request; 'buffered' queues
+# comments in memory (spooled to disk) and inserts them in batches from a
+# background thread (see blog/ingestion.py)
+BLOG_COMMENT_INGESTION = 'sync'
+BLOG_COMMENT_SPOOL = BASE_DIR / 'spool' / 'comments.jsonl'  # Durable copy of the buffered comments not inserted yet (one comments.<pid>.jsonl per process).
+BLOG_COMMENT_BUFFER_SIZE = 1000  # Pending comments per process before new submissions wait (backpressure).
+BLOG_COMMENT_BATCH_SIZE = 100  # Maximum comments inserted per bulk INSERT.
+BLOG_COMMENT_FLUSH_INTERVAL = 1.0  # Seconds between flushes when fewer than a batch of comments is pending.
+BLOG_COMMENT_SUBMIT_TIMEOUT = 2.0  # Seconds a submission waits for room in a full buffer before being refused.
+
+SEARCH_CACHE_SIZE = 500  # Result pages kept per process by the search cache (least recently used dropped first).
+SEARCH_CACHE_TIMEOUT = 5 * 60  # Seconds a cached search result page is reused (it is also dropped on content changes).
+SEARCH_RANKING_INDEX = BASE_DIR / 'search_index' / 'ranking.npz'  # BM25 index written by the build_search_ranking command.
+SEARCH_WORKERS = 8  # Threads running the search page's lookups concurrently (per process).
+SEARCH_SOURCE_TIMEOUT = 2.0  # Seconds a search lookup may take before the page is shown without its results.
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -143,3 +178,7 @@ MEDIA_ROOT = BASE_DIR / 'media'  # Filesystem directory for user-uploaded media.
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'  # Default field type for auto-generated primary keys.
 
 CART_SESSION_ID = 'cart'  # Key used to store cart data in the user's session.
+
+CART_STORAGE = 'session'  # Where the cart is kept: 'session' (default) or 'cookie' (signed cookie, no session writes).
+CART_COOKIE_NAME = 'cart'  # Name of the signed cookie used when CART_STORAGE = 'cookie'.
+CART_COOKIE_AGE = 60 * 60 * 24 * 14  # Lifetime of the cart cookie in seconds (two weeks).
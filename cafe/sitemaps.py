@@ -0,0 +1,182 @@
+"""XML sitemaps of the site's pages.
+
+``/sitemap.xml`` is a sitemap index pointing to one or more section
+sitemaps (``/sitemap-<section>-<page>.xml``):
+
+- ``static``: the fixed pages declared in ``cafe/urls.py`` and the apps;
+- ``posts``: published blog posts (``Post.get_absolute_url``);
+- ``categories``: blog categories (``Category.get_absolute_url``);
+- ``products``: available products (``Product.get_absolute_url``).
+
+Sections are split into pages of ``SITEMAP_CHUNK_SIZE`` URLs, well under
+the protocol's limits of 50,000 URLs and 50 MB per sitemap. Pages are
+generated by iterating over the rows with ``.iterator()`` (loading only
+the columns needed for the URL and ``lastmod``) and streamed to the
+client while being generated; the result is cached.
+
+Cached sitemaps are keyed by the version counters the rest of the site
+already maintains (``core.cache``): the blog listing version changes with
+any published post, the category navigation version with categories and
+the catalog version with products. A content change therefore gives the
+affected sections (and the index) new cache keys and ETags.
+"""
+
+import hashlib
+from xml.sax.saxutils import escape
+
+from django.urls import reverse
+
+from blog.caching import ALL_POSTS_VERSION, CATEGORIES_VERSION
+from blog.models import Category, Post
+from cart.catalog import CATALOG_VERSION
+from cart.models import Product
+from core.cache import get_version
+
+# URLs per section sitemap page
+SITEMAP_CHUNK_SIZE = 10000
+
+# How long generated sitemaps stay cached (keys change with the content)
+SITEMAP_CACHE_TIMEOUT = 60 * 60 * 24
+
+# URLs written per streamed chunk
+STREAM_BATCH = 500
+
+# Named URL patterns of the fixed pages
+STATIC_PAGES = [
+    'index', 'about', 'coffees', 'shop', 'search',
+    'blog:post_list', 'cart:product_list', 'core:contact', 'core:reserve',
+]
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+class Section:
+    """One sitemap section: a queryset of objects with their URL and lastmod."""
+
+    version_name = None
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def location(self, obj):
+        return obj.get_absolute_url()
+
+    def lastmod(self, obj):
+        return getattr(obj, 'updated', None)
+
+    def version(self):
+        return get_version(self.version_name) if self.version_name else 0
+
+    def count(self):
+        return self.get_queryset().count()
+
+    def entries(self, page):
+        """Yield ``(path, lastmod)`` for the objects of ``page`` (1-based)."""
+
+        start = (page - 1) * SITEMAP_CHUNK_SIZE
+        objects = self.get_queryset().order_by('pk')[start:start + SITEMAP_CHUNK_SIZE]
+        for obj in objects.iterator(chunk_size=STREAM_BATCH):
+            yield self.location(obj), self.lastmod(obj)
+
+
+class StaticSection(Section):
+    """The fixed pages of ``STATIC_PAGES`` (no database rows)."""
+
+    def count(self):
+        return len(STATIC_PAGES)
+
+    def entries(self, page):
+        start = (page - 1) * SITEMAP_CHUNK_SIZE
+        for name in STATIC_PAGES[start:start + SITEMAP_CHUNK_SIZE]:
+            yield reverse(name), None
+
+
+class PostSection(Section):
+    """Published blog posts."""
+
+    version_name = ALL_POSTS_VERSION
+
+    def get_queryset(self):
+        return Post.objects.filter(published=True).only('slug', 'updated')
+
+
+class CategorySection(Section):
+    """Blog categories (their listing pages)."""
+
+    version_name = CATEGORIES_VERSION
+
+    def get_queryset(self):
+        return Category.objects.only('slug')
+
+
+class ProductSection(Section):
+    """Available products."""
+
+    version_name = CATALOG_VERSION
+
+    def get_queryset(self):
+        return Product.objects.filter(available=True).only('slug', 'updated')
+
+
+SECTIONS = {
+    'static': StaticSection(),
+    'posts': PostSection(),
+    'categories': CategorySection(),
+    'products': ProductSection(),
+}
+
+
+def versions():
+    """Return the content versions of every section (the index depends on all)."""
+
+    return {name: section.version() for name, section in SECTIONS.items()}
+
+
+def _site_key(base_url):
+    # The scheme and host in a fixed length, safe in any cache backend's keys
+    return hashlib.md5(base_url.encode()).hexdigest()
+
+
+def section_cache_key(base_url, name, page):
+    # The chunk size decides which URLs a page holds
+    return f'sitemap:{name}:{SECTIONS[name].version()}:{SITEMAP_CHUNK_SIZE}:{page}:{_site_key(base_url)}'
+
+
+def index_cache_key(base_url):
+    version = '-'.join(str(version) for _, version in sorted(versions().items()))
+    return f'sitemap:index:{version}:{SITEMAP_CHUNK_SIZE}:{_site_key(base_url)}'
+
+
+def page_count(name):
+    """Number of pages of a section (at least one, possibly empty)."""
+
+    return max(1, -(-SECTIONS[name].count() // SITEMAP_CHUNK_SIZE))
+
+
+def generate_index(base_url):
+    """Yield the sitemap index listing every section page."""
+
+    yield f'{XML_HEADER}<sitemapindex xmlns="{XMLNS}">\n'
+    for name in SECTIONS:
+        for page in range(1, page_count(name) + 1):
+            location = base_url + reverse('sitemap_section', args=[name, page])
+            yield f'<sitemap><loc>{escape(location)}</loc></sitemap>\n'
+    yield '</sitemapindex>\n'
+
+
+def generate_section(base_url, name, page):
+    """Yield one section page, ``STREAM_BATCH`` URLs per chunk."""
+
+    yield f'{XML_HEADER}<urlset xmlns="{XMLNS}">\n'
+    batch = []
+    for path, lastmod in SECTIONS[name].entries(page):
+        entry = f'<url><loc>{escape(base_url + path)}</loc>'
+        if lastmod is not None:
+            entry += f'<lastmod>{lastmod.date().isoformat()}</lastmod>'
+        batch.append(entry + '</url>\n')
+        if len(batch) >= STREAM_BATCH:
+            yield ''.join(batch)
+            batch = []
+    yield ''.join(batch) + '</urlset>\n'
+
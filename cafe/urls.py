@@ -28,6 +28,12 @@ urlpatterns = [
 
     # Search page (aggregates results across apps)
     path('search/', views.search, name='search'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
+    path('search/cache-stats/', views.search_cache_stats, name='search_cache_stats'),
+
+    # XML sitemaps: an index and paginated sections (see cafe/sitemaps.py)
+    path('sitemap.xml', views.sitemap_index, name='sitemap_index'),
+    path('sitemap-<slug:section>-<int:page>.xml', views.sitemap_section, name='sitemap_section'),
 
     # Delegate blog/cart/registration URL handling to their apps and
     # use namespaces to avoid reverse() name collisions.
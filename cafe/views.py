@@ -1,29 +1,51 @@
 """Simple site-level views for the cafe project.
 
-These views render top-level pages (index, about, coffees, shop) and
+These views render top-level pages (index, about, coffees, shop),
 provide a search endpoint which aggregates results across multiple
-applications (products, blog posts, categories, comments).
+applications (products, blog posts, categories, comments), with
+as-you-type suggestions and the statistics of its result cache, and
+serve the XML sitemaps (see ``cafe/sitemaps.py``). The search view is
+asynchronous: its lookups run concurrently.
 """
 
-from django.shortcuts import render
-from django.db.models import Q # Import Q for complex queries in search view.
+from functools import partial
 
-# Application models imported for data queries used in the views below.
-from cart.models import Product
-from blog.models import Post, Category, Comment
-from core.models import Review, Contact  # Contact is imported for potential use in contact view (currently unused)
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render
+from django.views.decorators.http import condition
+
+from cart.catalog import get_catalog
+from cart.views import catalog_version  # Conditional GET validator for catalog pages
+from core.cache import stream_and_cache
+from core.conditional import conditional_page, make_etag
+from core.search import KINDS, search_page
+from core.search.cache import get_search_cache
+from core.search.fanout import gather_sources
+from core.search.ranking import ranked_search
+from core.search.suggest import suggest
+from . import sitemaps
+from core.models import Contact  # Contact is imported for potential use in contact view (currently unused)
+from core.reviews import get_home_reviews, get_user_review
 
 
 def index(request):
-    """Render the home page with recent reviews.
+    """Render the home page with recent reviews and the rating summary.
 
-    Retrieves up to three recent reviews and passes them to the
-    ``index.html`` template in the ``reviews`` context variable.
+    Passes up to three recent reviews to the ``index.html`` template in
+    the ``reviews`` context variable, the average rating and star
+    histogram in ``review_summary`` and the visitor's own review in
+    ``user_review``. All three come from the cache (see
+    ``core/reviews.py``), so rendering them costs no query once cached.
     """
 
-    reviews = Review.objects.all().order_by('-date')[:3]
+    home = get_home_reviews()
     context = {
-        'reviews': reviews,
+        'reviews': home.reviews,
+        'review_summary': home.summary,
+        'user_review': get_user_review(request.user),
     }
     return render(request, 'index.html', context)
 
@@ -40,14 +62,17 @@ def coffees(request):
     return render(request, 'coffees.html')
 
 
+@conditional_page(catalog_version)
 def shop(request):
     """Render the shop page showing a small selection of products.
 
-    Currently returns up to 6 available products. Templates can use the
-    ``products`` context variable to render the product list.
+    Currently returns up to 6 available products, read from the in-memory
+    catalog snapshot. Templates can use the ``products`` context variable
+    to render the product list. Answers 304 while the catalog version is
+    unchanged.
     """
 
-    products = Product.objects.filter(available=True)[:6]  # Show 6 products
+    products = get_catalog().available[:6]  # Show 6 products
     return render(request, 'shop.html', {'products': products})
 
 
@@ -55,61 +80,139 @@ def shop(request):
 #     return render(request, 'contact.html')
 
 
-def search(request):
-    """Aggregate search across products, posts, categories and comments.
+def _page_number(request, param):
+    # Page requested for one section of the results, 1 when missing or invalid
+    try:
+        return max(1, int(request.GET.get(param, 1)))
+    except ValueError:
+        return 1
+
 
-    Query parameter: ?q=<search term>
+def _page_url(request, param, number):
+    # The current search with one section moved to another page
+    params = request.GET.copy()
+    params[param] = number
+    return f'?{params.urlencode()}'
 
-    The view performs case-insensitive containment searches across a few
-    key fields in each model and returns the matching QuerySets in the
-    context. If the query is empty, empty lists are returned to the
-    template.
+
+async def search(request):
+    """Aggregate search across products, posts, categories and comments.
+
+    Query parameters: ?q=<search term>, and ?<type>_page=<n> (e.g.
+    ``product_page``) to page through the results of one type.
+
+    Every word of the query matches as a prefix. Results of each type
+    come from the full-text index (see ``core/search``), best matches
+    first, with the matching words highlighted in ``search_title`` and
+    ``search_snippet``. Each type shows at most ``RESULTS_PER_PAGE``
+    results per page and counts at most ``COUNT_CAP`` matches, so the
+    cost of a search does not grow with the size of the tables.
+    ``top_results`` merges the best products, posts and categories in
+    one BM25-ranked list (see ``core/search/ranking.py``).
+
+    The lookups run concurrently (``core/search/fanout.py``); the
+    names of those that timed out or failed are listed in
+    ``unavailable`` and their sections are shown without results. If the
+    query is empty, empty lists are returned to the template.
     """
 
     # Read and normalize the query string
     query = request.GET.get('q', '').strip()
 
-    # Default empty results
-    product_results = []
-    post_results = []
-    category_results = []
-    comment_results = []
-
+    lookups = {}
     if query:
-        # Search available products by name, description or slug
-        product_results = Product.objects.filter(available=True).filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(slug__icontains=query)
-        )
-
-        # Search published posts by several textual fields
-        post_results = Post.objects.filter(published=True).filter(
-            Q(title__icontains=query) |
-            Q(content__icontains=query) |
-            Q(excerpt__icontains=query) |
-            Q(slug__icontains=query)
-        )
-
-        # Search categories by name or slug
-        category_results = Category.objects.filter(
-            Q(name__icontains=query) |
-            Q(slug__icontains=query)
-        )
-
-        # Search comments by author name, email or content
-        comment_results = Comment.objects.filter(
-            Q(name__icontains=query) |
-            Q(email__icontains=query) |
-            Q(content__icontains=query)
-        )
+        # Best matches of all types together, by relevance
+        lookups['top'] = lambda: ranked_search(query)
+        for kind in KINDS:
+            # One bounded page of ranked objects per type
+            lookups[kind.name] = partial(search_page, query, kind, _page_number(request, f'{kind.name}_page'))
+    results, unavailable = await gather_sources(lookups)
 
     context = {
         'query': query,
-        'product_results': product_results,
-        'post_results': post_results,
-        'category_results': category_results,
-        'comment_results': comment_results,
+        'top_results': results.get('top', []),
+        'unavailable': unavailable,
     }
+    for kind in KINDS:
+        page = results.get(kind.name)
+        if page is not None:
+            param = f'{kind.name}_page'
+            page.next_url = _page_url(request, param, page.number + 1)
+            page.previous_url = _page_url(request, param, page.number - 1)
+        context[f'{kind.name}_page'] = page
+        context[f'{kind.name}_results'] = page.results if page else []
+
+    # Rendering may touch the database (e.g. the user in base.html)
+    return await sync_to_async(render)(request, 'search.html', context)
+
+
+def search_suggest(request):
+    """Return completions of a partly typed search as JSON.
+
+    Query parameter: ?q=<prefix>. Responds with
+    ``{"suggestions": [{"label", "url", "type"}, ...]}`` listing product
+    names, post titles and category names starting with the prefix (or
+    with a later word starting with it). Answered from the in-memory
+    index of ``core/search/suggest.py``, without database queries.
+    """
+
+    return JsonResponse({'suggestions': suggest(request.GET.get('q', ''))})
+
+
+@staff_member_required
+def search_cache_stats(request):
+    """Return this process's search cache statistics as JSON (staff only).
+
+    Reports the number of cached pages, hits, misses, hit ratio,
+    expirations, evictions and invalidations (see ``SearchCache.stats``).
+    """
+
+    return JsonResponse(get_search_cache().stats())
+
+
+# Sitemaps
+
+SITEMAP_CONTENT_TYPE = 'application/xml; charset=utf-8'
+
+
+def _base_url(request):
+    # Scheme and host prepended to the sitemap URLs
+    return request.build_absolute_uri('/').rstrip('/')
+
+
+def _serve_sitemap(key, generate):
+    # Serve a cached sitemap, or stream a freshly generated one while caching it
+    document = cache.get(key)
+    if document is not None:
+        return HttpResponse(document, content_type=SITEMAP_CONTENT_TYPE)
+    return StreamingHttpResponse(
+        stream_and_cache(generate(), key, sitemaps.SITEMAP_CACHE_TIMEOUT),
+        content_type=SITEMAP_CONTENT_TYPE,
+    )
+
+
+@condition(etag_func=lambda request: make_etag(sitemaps.index_cache_key(_base_url(request))))
+def sitemap_index(request):
+    """Serve the sitemap index (``/sitemap.xml``) listing the section pages."""
+
+    base_url = _base_url(request)
+    return _serve_sitemap(sitemaps.index_cache_key(base_url), lambda: sitemaps.generate_index(base_url))
+
+
+def _section_etag(request, section, page):
+    if section not in sitemaps.SECTIONS:
+        return None
+    return make_etag(sitemaps.section_cache_key(_base_url(request), section, page))
+
+
+@condition(etag_func=_section_etag)
+def sitemap_section(request, section, page):
+    """Serve one page of a sitemap section (``/sitemap-<section>-<page>.xml``)."""
 
-    return render(request, 'search.html', context)
+    if section not in sitemaps.SECTIONS or page < 1:
+        raise Http404('No such sitemap.')
+    base_url = _base_url(request)
+    key = sitemaps.section_cache_key(base_url, section, page)
+    if cache.get(key) is None and page > sitemaps.page_count(section):
+        raise Http404('No such sitemap.')
+    return _serve_sitemap(key, lambda: sitemaps.generate_section(base_url, section, page))
@@ -6,7 +6,7 @@ availability, etc.).
 """
 
 from django.contrib import admin
-from .models import Product
+from .models import Product, Cart, CartItem
 
 
 @admin.register(Product) 
@@ -27,4 +27,17 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
 
     # Add a date-based drill-down by the created timestamp
-    date_hierarchy = 'created'
\ No newline at end of file
+    date_hierarchy = 'created'
+
+
+class CartItemInline(admin.TabularInline):
+    model = CartItem
+    # Show the product as a raw id input instead of loading every product
+    raw_id_fields = ['product']
+    extra = 0
+
+
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'created', 'updated']
+    inlines = [CartItemInline]
@@ -15,3 +15,7 @@ class CartConfig(AppConfig):
         default_auto_field = 'django.db.models.BigAutoField'
         name = 'cart'
         verbose_name = 'Shopping Cart'
+
+        def ready(self):
+                # Register signal handlers (catalog cache invalidation)
+                from . import signals
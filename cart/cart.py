@@ -1,41 +1,138 @@
-"""Simple shopping cart backed by the user's session.
+"""Simple shopping cart backed by the session, a signed cookie or the database.
 
 The Cart class provides a small API to add/remove products and to
 iterate over items stored in the current session. Products are stored
-in the session by their ID along with quantity and price at the time
-they were added. The cart does not rely on any database object being
-persisted for the lifetime of the session; instead it looks up the
-Product objects on iteration to attach fresh model instances for
-display in templates.
+by their ID along with quantity and price (in integer cents) at the
+time they were added; see ``cart/storage.py`` for the encoding and the
+available storage backends. The cart does not rely on any database
+object being persisted for the lifetime of the session; instead it
+looks up the Product objects in the in-memory catalog snapshot and
+wraps them in read-only ``CartLine`` objects for display in templates.
 """
 
-from decimal import Decimal # For precise price calculations
-from django.conf import settings
-from .models import Product  # Use Product model from cart app
+from contextlib import contextmanager
+
+from .catalog import get_catalog  # In-memory snapshot of the Product table
+from .storage import get_storage, cart_totals, to_cents, from_cents
+
+
+class CartLine:
+    """A single hydrated cart line used for display.
+
+    Lines are built from the stored cart data once per request and are
+    never written back to storage, which keeps holding the plain JSON
+    payload only.
+
+    Attributes:
+    - product: the ``Product`` instance
+    - quantity: number of units (int)
+    - price: unit price at the time the product was added (Decimal)
+    - total_price: ``price * quantity`` (Decimal)
+    - update_quantity_form: optional form attached by views
+    """
+
+    __slots__ = ('product', 'quantity', 'price', 'total_price', 'update_quantity_form')
+
+    def __init__(self, product, quantity, price):
+        self.product = product
+        self.quantity = quantity
+        self.price = price
+        self.total_price = price * quantity
+        self.update_quantity_form = None
 
 
 class Cart:
-    """Session-backed shopping cart.
+    """Shopping cart backed by the session, a signed cookie or the database.
 
     Typical usage:
         cart = Cart(request)
         cart.add(product, quantity=2)
         for item in cart:
-            display(item['product'], item['quantity'], item['total_price'])
+            display(item.product, item.quantity, item.total_price)
 
-    The cart stores prices as strings in the session to avoid serialization
-    issues with Decimal objects; they are converted back to Decimal when
-    iterating or computing totals.
+    The cart stores prices as integer cents to avoid serialization issues
+    with Decimal objects; they are converted back to Decimal when
+    iterating. The item count and total (in cents) are kept as running
+    aggregates updated by every change, and hydrated lines are built at
+    most once per Cart instance until the cart changes.
     """
 
     def __init__(self, request):
-        # Keep a reference to the session and load (or create) the cart
-        self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID) #tries to get cart from session
-        if not cart:
-            # Initialize an empty cart in the session
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        # Load the cart through the configured storage backend (session,
+        # signed cookie or database). Nothing is written back here:
+        # storage is only updated by save() on the first real mutation,
+        # so merely looking at an empty cart never creates a session for
+        # the visitor.
+        self.storage = get_storage(request)
+        self._cart = None
+        self._lines = None
+        self._batching = False
+        # Running aggregates, kept up to date by add/remove/clear so
+        # len(cart) and get_total_price() never walk the lines
+        self._count = None
+        self._total_cents = None
+        self._total_price = None
+
+    @property
+    def cart(self):
+        """The decoded cart, ``{product_id: [quantity, price_cents]}``.
+
+        Loaded from storage on first use, so pages that only need the
+        totals (e.g. the header badge) can get them from
+        ``storage.get_totals()`` without reading every line.
+        """
+
+        if self._cart is None:
+            self._cart = self.storage.load()
+            self._check_totals()
+        return self._cart
+
+    def verify_totals(self):
+        """Check the running totals against the lines, rebuilding them if needed.
+
+        Returns True if the aggregates were consistent (or not stored).
+        The running totals, or the totals stored with the payload if
+        none were computed yet, are compared with the lines; if they
+        disagree, e.g. because the stored totals were written by buggy
+        code or edited by hand, they are recomputed from the lines and
+        saved back, and False is returned. This check also runs
+        automatically whenever the lines are loaded.
+        """
+
+        if self._cart is None:
+            self._cart = self.storage.load()
+        return self._check_totals()
+
+    def _check_totals(self):
+        totals = cart_totals(self._cart)
+        if self._count is None:
+            known = self.storage.get_stored_totals()
+        else:
+            known = (self._count, self._total_cents)
+        consistent = known is None or known == totals
+        self._set_totals(*totals)
+        if not consistent:
+            self.save()
+        return consistent
+
+    def _set_totals(self, count, total_cents):
+        self._count, self._total_cents = count, total_cents
+        self._total_price = None
+
+    def _adjust_totals(self, quantity_delta, price_cents):
+        # Apply the effect of a line change to the running aggregates
+        self._set_totals(self._count + quantity_delta,
+                         self._total_cents + quantity_delta * price_cents)
+
+    def _ensure_totals(self):
+        if self._count is None:
+            if self._cart is None:
+                # Let the storage provide the totals without loading the
+                # lines (stored aggregates, or one SQL aggregate for
+                # database-backed carts)
+                self._set_totals(*self.storage.get_totals())
+            else:
+                self._set_totals(*cart_totals(self._cart))
 
     def add(self, product, quantity=1, update_quantity=False):
         """Add a product to the cart or update its quantity.
@@ -45,74 +142,134 @@ class Cart:
         quantity for that product.
         """
 
-        product_id = str(product.id)
-        if product_id not in self.cart:
-            # Store quantity and price (as string) to keep session serializable
-            self.cart[product_id] = {
-                'quantity': 0,
-                'price': str(product.price),  # store as string for JSON/session safety
-            }
-        if update_quantity:
-            self.cart[product_id]['quantity'] = quantity
-        else:
-            self.cart[product_id]['quantity'] += quantity
+        # Store quantity and unit price (in integer cents) to keep storage compact
+        line = self.cart.setdefault(product.id, [0, to_cents(product.price)])
+        old_quantity = line[0]
+        line[0] = quantity if update_quantity else old_quantity + quantity
+        self._adjust_totals(line[0] - old_quantity, line[1])
         self.save()
 
     def save(self):
-        # Mark the session as modified so it will be saved by Django
-        self.session.modified = True
+        # Persist the encoded cart and its totals (creating the storage
+        # entry on the first mutation) and drop the hydrated lines.
+        # Inside batch() the write is deferred until the block exits.
+        self._lines = None
+        if not self._batching:
+            self.storage.save(self.cart, (self._count, self._total_cents))
+
+    @contextmanager
+    def batch(self):
+        """Group several changes into a single storage write.
+
+        Usage:
+            with cart.batch():
+                cart.add(product_a, 2)
+                cart.remove(product_b)
+
+        The cart is saved once when the block exits. If the block raises,
+        the pending changes are discarded and nothing is saved.
+        """
+
+        self._batching = True
+        try:
+            yield self
+        except BaseException:
+            # Forget the pending changes; reload from storage on next use
+            self._batching = False
+            self._cart = self._lines = None
+            self._count = self._total_cents = self._total_price = None
+            raise
+        self._batching = False
+        self.save()
 
     def remove(self, product):
         """Remove a product from the cart if present."""
 
-        product_id = str(product.id)
-        if product_id in self.cart:
-            del self.cart[product_id]
+        if product.id in self.cart:
+            quantity, price_cents = self.cart.pop(product.id)
+            self._adjust_totals(-quantity, price_cents)
             self.save()
 
+    def get_lines(self):
+        """Return the hydrated cart lines, built only once.
+
+        The first call looks up every product of the cart in the catalog
+        snapshot (see ``cart/catalog.py``) and builds a list of
+        :class:`CartLine` objects; later calls (the view loop, the
+        template loop...) reuse that list until the cart is modified.
+        Lines whose product no longer exists are skipped.
+        """
+
+        if self._lines is None:
+            products = get_catalog().by_id
+
+            lines = []
+            for product_id, (quantity, price_cents) in self.cart.items():
+                product = products.get(product_id)
+                if product is None:
+                    # Skip lines whose product has been deleted since it was added
+                    continue
+                lines.append(CartLine(product, quantity, from_cents(price_cents)))
+            self._lines = lines
+        return self._lines
+
     def __iter__(self):
-        """Iterate over the cart items, attaching Product instances.
+        """Iterate over the hydrated cart lines.
 
-        Yields items with keys: 'product' (model instance), 'price'
-        (Decimal), 'quantity' (int) and 'total_price' (Decimal).
+        Yields :class:`CartLine` objects exposing ``product``,
+        ``price``, ``quantity`` and ``total_price``. The stored cart data
+        is only read, never modified.
         """
 
-        product_ids = self.cart.keys()
-        # product_ids are stored as strings in the session; convert to ints for DB lookup
-        try:
-            product_ids_int = [int(pid) for pid in product_ids]
-        except ValueError:
-            # If conversion fails, fall back to using the string IDs
-            product_ids_int = list(product_ids)
-
-        # Fetch the Product objects for all IDs present in the cart
-        products = Product.objects.filter(id__in=product_ids_int)
-        cart = self.cart.copy()
-
-        # Attach the product instances to the session data copy so templates
-        # can access up-to-date model information (e.g. name, image)
-        for product in products:
-            cart[str(product.id)]['product'] = product
-
-        # Convert stored price strings back to Decimal and compute totals
-        for item in cart.values():
-            item['price'] = Decimal(item['price'])
-            item['total_price'] = item['price'] * item['quantity']
-            yield item
+        return iter(self.get_lines())
 
     def __len__(self):
-        """Return total quantity of all items in the cart."""
+        """Return total quantity of all items in the cart (O(1))."""
 
-        return sum(item['quantity'] for item in self.cart.values())
+        self._ensure_totals()
+        return self._count
+
+    def get_total_cents(self):
+        """Return the cart's total price in integer cents (O(1))."""
+
+        self._ensure_totals()
+        return self._total_cents
 
     def get_total_price(self):
-        """Compute the cart's total price as a Decimal."""
+        """Return the cart's total price as a Decimal.
+
+        The Decimal is built once from the running total and reused
+        until the cart changes.
+        """
+
+        if self._total_price is None:
+            self._total_price = from_cents(self.get_total_cents())
+        return self._total_price
+
+    def merge_into(self, other):
+        """Move this cart's lines into ``other`` and clear this cart.
+
+        Used on login to fold the anonymous session cart into the user's
+        database cart. Quantities of products present in both carts are
+        added up; lines for products that no longer exist are dropped.
+        The number of queries does not depend on the number of lines.
+        """
 
-        return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+        if not self.cart:
+            return
+        existing = get_catalog().by_id
+        for product_id, (quantity, price_cents) in self.cart.items():
+            if product_id in existing:
+                line = other.cart.setdefault(product_id, [0, price_cents])
+                line[0] += quantity
+                other._adjust_totals(quantity, line[1])
+        other.save()
+        self.clear()
 
     def clear(self):
-        """Remove the cart from the session."""
+        """Remove the cart from its storage."""
 
-        if settings.CART_SESSION_ID in self.session:
-            del self.session[settings.CART_SESSION_ID]
-        self.save()
\ No newline at end of file
+        self._cart = {}
+        self._lines = None
+        self._set_totals(0, 0)
+        self.storage.clear()
@@ -0,0 +1,68 @@
+"""In-process snapshot of the product catalog.
+
+The catalog changes only a few times a day (through the admin) but is
+read on most shop and cart requests. ``get_catalog()`` returns a
+``CatalogSnapshot`` built with a single query and kept in memory by
+each worker process. The snapshot is tagged with the ``catalog``
+version from ``core.cache``; saving or deleting a ``Product`` bumps that
+version (see ``cart/signals.py``) so every process reloads on its next
+read. The bump waits for the transaction to commit: a process reloading
+before that would read the old rows and keep them under the new version.
+
+Note that ``QuerySet.update()`` does not send model signals; code that
+updates products in bulk should call ``invalidate_catalog()`` itself.
+"""
+
+import threading
+
+from django.db import transaction
+
+from core.cache import get_version, bump_version
+
+from .models import Product
+
+CATALOG_VERSION = 'catalog'
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+class CatalogSnapshot:
+    """Immutable view of all products at a given catalog version.
+
+    - by_id: ``{id: Product}`` for every product (used to hydrate carts)
+    - by_slug: ``{slug: Product}`` for every product
+    - available: available products in the default (name) ordering
+    """
+
+    def __init__(self, products, version):
+        self.version = version
+        self.by_id = {product.id: product for product in products}
+        self.by_slug = {product.slug: product for product in products}
+        self.available = [product for product in products if product.available]
+
+
+def get_catalog():
+    """Return an up-to-date catalog snapshot, reloading it if stale."""
+
+    global _snapshot
+    version = get_version(CATALOG_VERSION)
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = _snapshot = CatalogSnapshot(list(Product.objects.all()), version)
+    return snapshot
+
+
+def _invalidate():
+    global _snapshot
+    bump_version(CATALOG_VERSION)
+    _snapshot = None
+
+
+def invalidate_catalog():
+    """Drop the snapshot of every process once the current transaction commits."""
+
+    transaction.on_commit(_invalidate)
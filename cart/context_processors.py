@@ -1,13 +1,23 @@
 """Context processors for the cart app.
 
 Provides a ``cart`` variable in template contexts which contains the
-session-backed Cart instance for the current request/user.
+session-backed Cart instance for the current request/user. The Cart is
+wrapped in a lazy proxy so pages that never use the variable do not
+read the session at all.
 """
 
+from django.utils.functional import SimpleLazyObject
+
 from .cart import Cart
 
 
 def cart(request):
-    """Return a mapping to inject the Cart into template contexts."""
+    """Return a mapping to inject a lazily built Cart into template contexts.
+
+    The Cart is only constructed the first time a template touches the
+    ``cart`` variable (e.g. ``cart|length`` in the header badge). Since
+    constructing a Cart never writes to the session, anonymous visitors
+    who don't modify the cart do not get a session row created for them.
+    """
 
-    return {'cart': Cart(request)}
\ No newline at end of file
+    return {'cart': SimpleLazyObject(lambda: Cart(request))}
@@ -1,7 +1,8 @@
 """Forms used by the cart views.
 
-Currently includes a simple form used to add products to the cart.
-The ``update`` field is a hidden boolean used to indicate whether the
+Includes a simple form used to add products to the cart and a form
+validating the operations posted to the batch JSON endpoint. The
+``update`` field is a hidden boolean used to indicate whether the
 quantity should be replaced or incremented.
 """
 
@@ -19,4 +20,24 @@ class CartAddProductForm(forms.Form):
 
     # Hidden field used by the view to decide whether to update (set)
     # the quantity or increment the existing one.
-    update = forms.BooleanField(required=False, initial=False, widget=forms.HiddenInput)
\ No newline at end of file
+    update = forms.BooleanField(required=False, initial=False, widget=forms.HiddenInput)
+
+class CartOperationForm(forms.Form):
+    """Validate a single operation sent to the batch cart endpoint.
+
+    ``add`` increments the quantity, ``set`` replaces it and ``remove``
+    drops the product from the cart (``quantity`` is ignored).
+    """
+
+    OPERATIONS = [('add', 'Add'), ('set', 'Set'), ('remove', 'Remove')]
+
+    op = forms.ChoiceField(choices=OPERATIONS)
+    product_id = forms.IntegerField(min_value=1)
+    # Same bounds as CartAddProductForm; required for add/set only
+    quantity = forms.IntegerField(min_value=1, max_value=20, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('op') in ('add', 'set') and cleaned_data.get('quantity') is None:
+            self.add_error('quantity', 'This field is required.')
+        return cleaned_data
@@ -0,0 +1,37 @@
+"""Middleware for the cart app.
+
+``CartCookieMiddleware`` writes pending cart changes made through
+``CookieCartStorage`` (see ``cart/storage.py``) to the response as a
+signed cookie. With the default session storage it does nothing.
+"""
+
+import json
+
+from django.conf import settings
+
+from .storage import CART_COOKIE_SALT, DELETE_COOKIE
+
+
+class CartCookieMiddleware:
+    """Persist a modified cookie-backed cart on the outgoing response."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        payload = getattr(request, '_cart_cookie', None)
+        if payload is DELETE_COOKIE:
+            response.delete_cookie(settings.CART_COOKIE_NAME, samesite='Lax')
+        elif payload is not None:
+            # Compact separators keep the cookie well under browser limits
+            response.set_signed_cookie(
+                settings.CART_COOKIE_NAME,
+                json.dumps(payload, separators=(',', ':')),
+                salt=CART_COOKIE_SALT,
+                max_age=settings.CART_COOKIE_AGE,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
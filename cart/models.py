@@ -1,9 +1,9 @@
 """Models for the cart application.
 
-Defines a simple Product model and includes commented-out models for
-an alternative database-backed cart implementation (Cart and
-CartItem). The live implementation uses a session-backed cart in
-``cart/cart.py`` instead of the commented models.
+Defines a simple Product model and the database-backed cart models
+(Cart and CartItem) used to persist the carts of authenticated users.
+Anonymous visitors use the session (or signed cookie) cart implemented
+in ``cart/cart.py`` and ``cart/storage.py``.
 """
 
 from django.db import models
@@ -45,28 +45,53 @@ class Product(models.Model):
         return reverse('cart:product_detail', args=[self.slug])
 
 
-# The following models are an optional database-backed cart
-# implementation. They are currently commented out because the
-# project uses a lightweight session-backed cart (see cart/cart.py).
-#
-# class Cart(models.Model):
-#     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
-#     created = models.DateTimeField(auto_now_add=True)
-#     updated = models.DateTimeField(auto_now=True)
-#
-#     def __str__(self):
-#         return f'Cart {self.id}'
-#
-#     def get_total_cost(self):
-#         return sum(item.get_cost() for item in self.items.all())
-#
-# class CartItem(models.Model):
-#     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
-#     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-#     quantity = models.PositiveIntegerField(default=1)
-#
-#     def __str__(self):
-#         return f'{self.quantity} x {self.product.name}'
-#
-#     def get_cost(self):
-#         return self.product.price * self.quantity
\ No newline at end of file
+class Cart(models.Model):
+    """Persistent cart belonging to an authenticated user.
+
+    Logged-in users keep their cart in the database (see
+    ``DatabaseCartStorage`` in ``cart/storage.py``) so it survives
+    session expiry; anonymous visitors still use the session or cookie
+    storage. Each user has at most one cart.
+    """
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cart')
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Cart {self.id}'
+
+    def get_total_cost(self):
+        """Return the cart total as a Decimal, aggregated in SQL."""
+
+        from .storage import from_cents  # local import: storage imports these models
+        cents = self.items.aggregate(
+            total=models.Sum(models.F('quantity') * models.F('price_cents'))
+        )['total']
+        return from_cents(cents or 0)
+
+
+class CartItem(models.Model):
+    """A product line in a persistent cart.
+
+    The unit price is stored in integer cents at the time the product
+    was added, matching the session cart encoding. ``(cart, product)``
+    is unique so lines can be bulk upserted.
+    """
+
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    price_cents = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product.name}'
+
+    def get_cost(self):
+        from .storage import from_cents
+        return from_cents(self.price_cents * self.quantity)
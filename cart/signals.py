@@ -0,0 +1,18 @@
+"""Signal handlers for the cart app.
+
+Connected in ``CartConfig.ready()``.
+"""
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .catalog import invalidate_catalog
+from .models import Product
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, **kwargs):
+    """Invalidate the catalog snapshot once a product change commits."""
+
+    invalidate_catalog()
@@ -0,0 +1,309 @@
+"""Storage backends and wire format for the shopping cart.
+
+The cart is persisted as a compact, versioned payload::
+
+    {"v": 2, "items": [[<product id>, <quantity>, <unit price in cents>], ...],
+     "totals": [<item count>, <total in cents>]}
+
+Product ids and prices are plain integers, so the payload is small and
+cheap to (de)serialize. The optional ``totals`` entry holds the cart's
+running aggregates so the header badge can be rendered without walking
+the lines. The ``v`` key lets ``decode_cart`` migrate older
+payloads; the original format (``{"<id>": {"quantity": n, "price":
+"4.50"}}``, treated as version 1) is still understood so carts stored in
+existing sessions keep working.
+
+Carts of anonymous visitors use one of two storage backends selected
+by the ``CART_STORAGE`` setting:
+
+- ``'session'`` (default): the payload lives in the Django session.
+- ``'cookie'``: the payload lives in a signed cookie, so cart changes
+  never need a server-side session read or write. The cookie is written
+  by ``cart.middleware.CartCookieMiddleware``.
+
+Authenticated users keep their cart in the database
+(``DatabaseCartStorage``) so it survives session expiry.
+"""
+
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import Cart as CartModel, CartItem
+
+# Current version of the encoded cart payload
+CART_SCHEMA_VERSION = 2
+
+# Salt used when signing the cart cookie so its signature can't be
+# reused for any other signed value on the site
+CART_COOKIE_SALT = 'cart.storage'
+
+# Sentinel stored on the request when the cart cookie must be deleted
+DELETE_COOKIE = object()
+
+
+def to_cents(price):
+    """Convert a Decimal (or Decimal string) price to integer cents."""
+
+    return int((Decimal(price) * 100).to_integral_value())
+
+
+def from_cents(cents):
+    """Convert integer cents back to a two-decimal-place Decimal."""
+
+    return Decimal(cents).scaleb(-2)
+
+
+def encode_cart(cart, totals=None):
+    """Encode ``{product_id: [quantity, price_cents]}`` as a versioned payload.
+
+    ``totals`` is the ``(item_count, total_cents)`` pair maintained by
+    the Cart; it is stored alongside the lines when given.
+    """
+
+    payload = {
+        'v': CART_SCHEMA_VERSION,
+        'items': [[product_id, line[0], line[1]] for product_id, line in cart.items()],
+    }
+    if totals is not None:
+        payload['totals'] = list(totals)
+    return payload
+
+
+def _decode_v1(data):
+    # Original format: {"<id>": {"quantity": n, "price": "4.50"}}
+    cart = {}
+    for product_id, item in data.items():
+        if str(product_id).isdigit():
+            cart[int(product_id)] = [int(item['quantity']), to_cents(item['price'])]
+    return cart
+
+
+def _decode_v2(data):
+    return {int(product_id): [int(quantity), int(cents)]
+            for product_id, quantity, cents in data['items']}
+
+
+# Decoders indexed by payload version. When the format changes, bump
+# CART_SCHEMA_VERSION and add a decoder for the new version here.
+_DECODERS = {
+    1: _decode_v1,
+    2: _decode_v2,
+}
+
+
+def decode_cart(data):
+    """Decode a stored payload into ``{product_id: [quantity, price_cents]}``.
+
+    Returns an empty cart for missing, unknown or malformed payloads.
+    """
+
+    if not data or not isinstance(data, dict):
+        return {}
+    # Version 1 payloads predate the 'v' key
+    decoder = _DECODERS.get(data.get('v', 1))
+    if decoder is None:
+        return {}
+    try:
+        return decoder(data)
+    except (KeyError, TypeError, ValueError, ArithmeticError):
+        return {}
+
+
+def cart_totals(cart):
+    """Return ``(item_count, total_cents)`` for a decoded cart."""
+
+    count = cents = 0
+    for quantity, price_cents in cart.values():
+        count += quantity
+        cents += quantity * price_cents
+    return count, cents
+
+
+def decode_totals(data):
+    """Return the stored ``(item_count, total_cents)`` of a payload, or None."""
+
+    try:
+        count, cents = data['totals']
+        return int(count), int(cents)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class BaseCartStorage:
+    """Interface shared by the cart storage backends.
+
+    Backends implement ``load()``, ``save(cart, totals)`` and
+    ``clear()``. ``get_totals()`` returns ``(item_count, total_cents)``
+    without the caller having to load every line; by default it reads
+    the totals stored in the payload returned by ``get_payload()``.
+    ``get_stored_totals()`` returns those stored totals as they are (None
+    if there are none), for checking them against the lines.
+    """
+
+    def get_payload(self):
+        raise NotImplementedError
+
+    def load(self):
+        return decode_cart(self.get_payload())
+
+    def save(self, cart, totals):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def get_totals(self):
+        payload = self.get_payload()
+        # Payloads written before totals were stored don't have them
+        return decode_totals(payload or {}) or cart_totals(decode_cart(payload))
+
+    def get_stored_totals(self):
+        return decode_totals(self.get_payload() or {})
+
+
+class SessionCartStorage(BaseCartStorage):
+    """Keep the encoded cart in the Django session."""
+
+    def __init__(self, request):
+        self.session = request.session
+
+    def get_payload(self):
+        return self.session.get(settings.CART_SESSION_ID)
+
+    def save(self, cart, totals):
+        # Assigning the key creates the session entry on the first
+        # mutation and marks the session as modified
+        self.session[settings.CART_SESSION_ID] = encode_cart(cart, totals)
+
+    def clear(self):
+        # Only touch the session when there is something to remove
+        if settings.CART_SESSION_ID in self.session:
+            del self.session[settings.CART_SESSION_ID]
+
+
+class CookieCartStorage(BaseCartStorage):
+    """Keep the encoded cart in a signed cookie.
+
+    Changes are recorded on the request and written to the response by
+    ``CartCookieMiddleware``. Pending changes are also visible to any
+    other Cart built later during the same request.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    def get_payload(self):
+        pending = getattr(self.request, '_cart_cookie', None)
+        if pending is DELETE_COOKIE:
+            return None
+        if pending is not None:
+            return pending
+        try:
+            value = self.request.get_signed_cookie(
+                settings.CART_COOKIE_NAME, salt=CART_COOKIE_SALT,
+                max_age=settings.CART_COOKIE_AGE,
+            )
+            return json.loads(value)
+        except (KeyError, signing.BadSignature, ValueError):
+            # Missing, tampered with, expired or unreadable cookie
+            return None
+
+    def save(self, cart, totals):
+        self.request._cart_cookie = encode_cart(cart, totals)
+
+    def clear(self):
+        if settings.CART_COOKIE_NAME in self.request.COOKIES or hasattr(self.request, '_cart_cookie'):
+            self.request._cart_cookie = DELETE_COOKIE
+
+
+class DatabaseCartStorage(BaseCartStorage):
+    """Keep an authenticated user's cart in the ``Cart``/``CartItem`` tables.
+
+    ``load()`` reads all lines with one query and remembers them, so
+    ``save()`` only writes what changed: one bulk upsert on the unique
+    ``(cart, product)`` pair for added/updated lines and one delete for
+    removed lines. Totals are aggregated in SQL.
+    """
+
+    def __init__(self, request):
+        self.user = request.user
+        self._stored = {}
+        self._cart_id = None
+
+    def _items(self):
+        return CartItem.objects.filter(cart__user=self.user)
+
+    def load(self):
+        self._stored = {
+            product_id: (quantity, price_cents)
+            for product_id, quantity, price_cents
+            in self._items().values_list('product_id', 'quantity', 'price_cents')
+        }
+        return {product_id: list(line) for product_id, line in self._stored.items()}
+
+    def get_totals(self):
+        totals = self._items().aggregate(
+            count=Sum('quantity'),
+            cents=Sum(F('quantity') * F('price_cents')),
+        )
+        return totals['count'] or 0, totals['cents'] or 0
+
+    def get_stored_totals(self):
+        # Nothing to check: the totals are always aggregated from the lines
+        return None
+
+    def _get_cart_id(self):
+        if self._cart_id is None:
+            self._cart_id = CartModel.objects.get_or_create(user=self.user)[0].id
+        return self._cart_id
+
+    def save(self, cart, totals):
+        # The totals are aggregated in SQL by get_totals() and don't need storing
+        changed = [
+            (product_id, tuple(line)) for product_id, line in cart.items()
+            if self._stored.get(product_id) != tuple(line)
+        ]
+        removed = [product_id for product_id in self._stored if product_id not in cart]
+        if not changed and not removed:
+            return
+
+        with transaction.atomic():
+            cart_id = self._get_cart_id()
+            if changed:
+                CartItem.objects.bulk_create(
+                    [CartItem(cart_id=cart_id, product_id=product_id,
+                              quantity=quantity, price_cents=price_cents)
+                     for product_id, (quantity, price_cents) in changed],
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product'],
+                    update_fields=['quantity', 'price_cents'],
+                )
+            if removed:
+                CartItem.objects.filter(cart_id=cart_id, product_id__in=removed).delete()
+        self._stored = {product_id: tuple(line) for product_id, line in cart.items()}
+
+    def clear(self):
+        self._items().delete()
+        self._stored = {}
+
+
+# Storage backends for anonymous visitors, selectable through
+# settings.CART_STORAGE. Authenticated users always use the database.
+STORAGE_BACKENDS = {
+    'session': SessionCartStorage,
+    'cookie': CookieCartStorage,
+}
+
+
+def get_storage(request):
+    """Return the storage backend to use for this request."""
+
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return DatabaseCartStorage(request)
+    return STORAGE_BACKENDS[getattr(settings, 'CART_STORAGE', 'session')](request)
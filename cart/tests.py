@@ -1,3 +1,227 @@
-from django.test import TestCase
+import json
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .cart import Cart
+from core.cache import get_version
+
+from .catalog import CATALOG_VERSION, get_catalog
+from .models import CartItem, Product
+
+
+def make_product(name, price):
+    # The catalog snapshot is invalidated when the change commits
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        return Product.objects.create(
+            name=name, slug=name.lower(), description=name, price=price, image='products/test.jpg',
+        )
+
+
+def anonymous_request():
+    request = RequestFactory().get('/')
+    request.session = SessionStore()
+    request.user = AnonymousUser()
+    return request
+
+
+class CartTotalsTests(TestCase):
+    """Running totals of the session cart."""
+
+    def setUp(self):
+        self.espresso = make_product('Espresso', '2.50')
+        self.latte = make_product('Latte', '4.00')
+        self.request = anonymous_request()
+
+    def assertStoredTotals(self, count, cents):
+        self.assertEqual(self.request.session['cart']['totals'], [count, cents])
+
+    def test_add_remove_clear(self):
+        cart = Cart(self.request)
+        cart.add(self.espresso, quantity=2)
+        cart.add(self.espresso)
+        cart.add(self.latte)
+        self.assertEqual(len(cart), 4)
+        self.assertEqual(cart.get_total_cents(), 1150)
+        self.assertStoredTotals(4, 1150)
+
+        cart.add(self.latte, quantity=2, update_quantity=True)
+        cart.remove(self.espresso)
+        self.assertEqual(len(cart), 2)
+        self.assertEqual(cart.get_total_cents(), 800)
+        self.assertStoredTotals(2, 800)
+
+        # A new Cart reads the stored totals, which match the lines
+        cart = Cart(self.request)
+        self.assertEqual(len(cart), 2)
+        self.assertTrue(cart.verify_totals())
+
+        cart.clear()
+        self.assertEqual(len(cart), 0)
+        self.assertEqual(cart.get_total_cents(), 0)
+        self.assertNotIn('cart', self.request.session)
+
+    def test_corrupted_totals_are_repaired(self):
+        self.request.session['cart'] = {
+            'v': 2,
+            'items': [[self.espresso.id, 1, 250], [self.latte.id, 1, 400]],
+            'totals': [99, 12345],
+        }
+        cart = Cart(self.request)
+        self.assertFalse(cart.verify_totals())
+        self.assertEqual(len(cart), 2)
+        self.assertEqual(cart.get_total_cents(), 650)
+        self.assertStoredTotals(2, 650)
+        self.assertTrue(Cart(self.request).verify_totals())
+
+    def test_corrupted_totals_are_repaired_when_lines_are_loaded(self):
+        self.request.session['cart'] = {
+            'v': 2, 'items': [[self.latte.id, 3, 400]], 'totals': [1, 1],
+        }
+        cart = Cart(self.request)
+        self.assertEqual([line.quantity for line in cart], [3])
+        self.assertEqual(len(cart), 3)
+        self.assertStoredTotals(3, 1200)
+
+    def test_payload_without_totals(self):
+        self.request.session['cart'] = {'v': 2, 'items': [[self.latte.id, 2, 400]]}
+        cart = Cart(self.request)
+        self.assertTrue(cart.verify_totals())
+        self.assertEqual(len(cart), 2)
+        self.assertEqual(cart.get_total_cents(), 800)
+
+
+class CatalogTests(TestCase):
+    """The catalog snapshot follows committed product changes."""
+
+    def test_snapshot_invalidated_on_commit(self):
+        latte = make_product('Latte', '4.00')
+        self.assertEqual(get_catalog().by_id[latte.id].price, Decimal('4.00'))
+        version = get_version(CATALOG_VERSION)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            latte.price = Decimal('4.20')
+            latte.save()
+            # Until the commit, other processes keep the old version
+            self.assertEqual(get_version(CATALOG_VERSION), version)
+        self.assertNotEqual(get_version(CATALOG_VERSION), version)
+        self.assertEqual(get_catalog().by_id[latte.id].price, Decimal('4.20'))
+
+
+class CartMergeTests(TestCase):
+    """Folding the anonymous cart into the user's database cart on login."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.espresso = make_product('Espresso', '2.50')
+        self.latte = make_product('Latte', '4.00')
+
+    def user_request(self, user=None):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.user = user or self.user
+        return request
+
+    def test_quantities_added_and_deleted_products_dropped(self):
+        Cart(self.user_request()).add(self.espresso, quantity=1)
+        mocha = make_product('Mocha', '3.00')
+        request = anonymous_request()
+        anonymous_cart = Cart(request)
+        anonymous_cart.add(self.espresso, quantity=2)
+        anonymous_cart.add(self.latte)
+        anonymous_cart.add(mocha)
+        with self.captureOnCommitCallbacks(execute=True):
+            mocha.delete()
+
+        anonymous_cart = Cart(request)
+        anonymous_cart.merge_into(Cart(self.user_request()))
+
+        self.assertEqual(
+            dict(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity')),
+            {self.espresso.id: 3, self.latte.id: 1},
+        )
+        user_cart = Cart(self.user_request())
+        self.assertEqual(len(user_cart), 4)
+        self.assertEqual(user_cart.get_total_cents(), 1150)
+        self.assertNotIn('cart', request.session)
+
+    def merge_queries(self, products):
+        request = anonymous_request()
+        anonymous_cart = Cart(request)
+        with anonymous_cart.batch():
+            for product in products:
+                anonymous_cart.add(product)
+        user = User.objects.create_user(f'user{len(products)}')
+        anonymous_cart = Cart(request)
+        with CaptureQueriesContext(connection) as queries:
+            anonymous_cart.merge_into(Cart(self.user_request(user)))
+        self.assertEqual(CartItem.objects.filter(cart__user=user).count(), len(products))
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_lines(self):
+        products = [make_product(f'Blend{number}', '5.00') for number in range(10)]
+        get_catalog()
+        self.assertEqual(self.merge_queries(products[:1]), self.merge_queries(products))
+
+    def test_login_merges_the_session_cart(self):
+        self.client.post(reverse('cart:cart_add', args=[self.latte.id]), {'quantity': 2})
+        response = self.client.post(reverse('registration:login'), {'username': 'alice', 'password': 'secret'})
+        self.assertRedirects(response, reverse('index'), fetch_redirect_response=False)
+        self.assertEqual(
+            list(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity')),
+            [(self.latte.id, 2)],
+        )
+        self.assertNotIn('cart', self.client.session)
+
+
+class CartBatchTests(TestCase):
+    """The batch endpoint applies all operations or none."""
+
+    def setUp(self):
+        self.espresso = make_product('Espresso', '2.50')
+        self.latte = make_product('Latte', '4.00')
+        self.client.post(reverse('cart:cart_add', args=[self.espresso.id]), {'quantity': 1})
+        self.stored = self.client.session['cart']
+
+    def post_batch(self, body):
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        return self.client.post(reverse('cart:cart_batch'), body, content_type='application/json')
+
+    def assertRejected(self, response):
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.session['cart'], self.stored)
+        return response.json()
+
+    def test_applies_every_operation(self):
+        response = self.post_batch({'operations': [
+            {'op': 'add', 'product_id': self.espresso.id, 'quantity': 2},
+            {'op': 'set', 'product_id': self.latte.id, 'quantity': 1},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_items'], 4)
+        self.assertEqual(response.json()['total_price'], '11.50')
+
+    def test_malformed_body(self):
+        self.assertIn('error', self.assertRejected(self.post_batch('not json')))
+        self.assertIn('error', self.assertRejected(self.post_batch({'operations': 'add'})))
+
+    def test_invalid_operation_rejects_the_batch(self):
+        data = self.assertRejected(self.post_batch({'operations': [
+            {'op': 'add', 'product_id': self.latte.id, 'quantity': 1},
+            {'op': 'set', 'product_id': self.espresso.id, 'quantity': 0},
+        ]}))
+        self.assertEqual(data['index'], 1)
+        self.assertIn('quantity', data['errors'])
+
+    def test_unknown_product_rejects_the_batch(self):
+        data = self.assertRejected(self.post_batch({'operations': [
+            {'op': 'remove', 'product_id': self.espresso.id},
+            {'op': 'add', 'product_id': self.latte.id + 100, 'quantity': 1},
+        ]}))
+        self.assertEqual(data['product_ids'], [self.latte.id + 100])
@@ -16,6 +16,7 @@ urlpatterns = [
     path('add/<int:product_id>/', views.cart_add, name='cart_add'), # Add a product to the cart
     path('remove/<int:product_id>/', views.cart_remove, name='cart_remove'), # Remove a product from the cart
     path('clear/', views.cart_clear, name='cart_clear'), # Clear all items from the cart
+    path('batch/', views.cart_batch, name='cart_batch'), # Apply several add/set/remove operations as JSON
 
     # Product listing and detail pages within the cart app
     path('products/', views.product_list, name='product_list'),
@@ -5,26 +5,46 @@ the session-backed cart (add, remove, clear). Views that modify state
 use the ``require_POST`` decorator to avoid side effects on GET requests.
 """
 
+import json
+
+from django.db import transaction
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.decorators.http import require_POST
 
 # Local application imports
 from .models import Product  # Product model used to list and lookup products
 from .cart import Cart
-from .forms import CartAddProductForm
+from .catalog import CATALOG_VERSION, get_catalog
+from core.cache import get_version
+from core.conditional import conditional_page
+from .forms import CartAddProductForm, CartOperationForm
+
+# Maximum number of operations accepted by a single batch request
+MAX_BATCH_OPERATIONS = 50
+
+
+def catalog_version(request, *args, **kwargs):
+    """Conditional GET validator for pages rendered from the catalog."""
 
+    return get_version(CATALOG_VERSION)
 
+
+@conditional_page(catalog_version)
 def product_list(request):
     """Render a list of available products.
 
     Returns the ``cart/product_list.html`` template with a ``products``
-    context variable containing available Product instances.
+    context variable containing available Product instances, read from
+    the in-memory catalog snapshot. Answers 304 while the catalog
+    version is unchanged.
     """
     # view for displaying list of products
-    products = Product.objects.filter(available=True) 
+    products = get_catalog().available
     return render(request, 'cart/product_list.html', {'products': products})
 
 
+@conditional_page(catalog_version)
 def product_detail(request, slug):
     """Show product details and a small form to add the product to cart.
 
@@ -32,7 +52,9 @@ def product_detail(request, slug):
     template renders for posting to the ``cart_add`` view.
     """
 
-    product = get_object_or_404(Product, slug=slug, available=True)
+    product = get_catalog().by_slug.get(slug)
+    if product is None or not product.available:
+        raise Http404('No Product matches the given query.')
     cart_product_form = CartAddProductForm()
     return render(request, 'cart/product_detail.html', {
         'product': product,
@@ -79,14 +101,83 @@ def cart_detail(request):
 
     cart = Cart(request) # Get the cart current instance
     for item in cart:
-        item['update_quantity_form'] = CartAddProductForm(initial={
-            'quantity': item['quantity'],
+        item.update_quantity_form = CartAddProductForm(initial={
+            'quantity': item.quantity,
             'update': True,
         })
-    #iterate through cart items and add update form to each item
+    #iterate through cart items and add update form to each item. The same
+    #hydrated lines are reused by the template, so they are only built once.
     return render(request, 'cart/cart_detail.html', {'cart': cart})
 
 
+def cart_summary(cart):
+    """Return a JSON-serializable summary of the cart contents."""
+
+    return {
+        'items': [{
+            'product_id': item.product.id,
+            'name': item.product.name,
+            'quantity': item.quantity,
+            'price': str(item.price),
+            'total_price': str(item.total_price),
+        } for item in cart],
+        'total_items': len(cart),
+        'total_price': str(cart.get_total_price()),
+    }
+
+
+@require_POST
+def cart_batch(request):
+    """Apply several cart operations at once and return the new cart.
+
+    Expects a JSON body such as::
+
+        {"operations": [
+            {"op": "add", "product_id": 1, "quantity": 2},
+            {"op": "set", "product_id": 2, "quantity": 1},
+            {"op": "remove", "product_id": 3}
+        ]}
+
+    The operations are applied atomically: if any of them is invalid or
+    refers to an unknown product, nothing is changed and a 400 response
+    with the errors is returned. Products are looked up in the catalog
+    snapshot and the cart is saved once. On success the response contains
+    the cart summary so the client doesn't need to reload the page.
+    """
+
+    try:
+        operations = json.loads(request.body)['operations']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON object with an "operations" list.'}, status=400)
+    if not isinstance(operations, list) or len(operations) > MAX_BATCH_OPERATIONS:
+        return JsonResponse({'error': f'"operations" must be a list of at most {MAX_BATCH_OPERATIONS} items.'}, status=400)
+
+    # Validate every operation before touching the cart
+    cleaned = []
+    for index, operation in enumerate(operations):
+        form = CartOperationForm(operation if isinstance(operation, dict) else {})
+        if not form.is_valid():
+            return JsonResponse({'error': 'Invalid operation.', 'index': index, 'errors': form.errors}, status=400)
+        cleaned.append(form.cleaned_data)
+
+    cart = Cart(request)
+    # Referenced products and the ones already in the cart come from the catalog snapshot
+    products = get_catalog().by_id
+    missing = sorted({op['product_id'] for op in cleaned}.difference(products))
+    if missing:
+        return JsonResponse({'error': 'Unknown product.', 'product_ids': missing}, status=400)
+
+    with transaction.atomic(), cart.batch():
+        for op in cleaned:
+            product = products[op['product_id']]
+            if op['op'] == 'remove':
+                cart.remove(product)
+            else:
+                cart.add(product=product, quantity=op['quantity'], update_quantity=op['op'] == 'set')
+
+    return JsonResponse(cart_summary(cart))
+
+
 @require_POST
 def cart_clear(request):
     """Clear the cart from the session and redirect to cart detail."""
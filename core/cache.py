@@ -0,0 +1,67 @@
+"""Cross-process version counters stored in Django's cache.
+
+Several features keep data in memory or in the cache (the product
+catalog snapshot, rendered fragments, search results...). Each of them
+is tagged with a named version number kept in the shared cache: writers
+call ``bump_version(name)`` when the underlying data changes and readers
+compare the version they built their data with against
+``get_version(name)``. Every worker process therefore notices a change
+made by any other process on its next read, as long as the configured
+cache backend is shared between processes (e.g. Redis or Memcached
+rather than the default per-process local-memory cache).
+
+``stream_and_cache`` helps views that stream a generated document (feeds,
+sitemaps) cache it at the same time.
+"""
+
+import time
+
+from django.core.cache import cache
+
+
+def _key(name):
+    return f'version:{name}'
+
+
+def _initial_version():
+    # Seed new (or evicted) counters from the clock so a counter that
+    # disappears from the cache never restarts at a value some process
+    # still has data cached for.
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    """Return the current version number for ``name``."""
+
+    key = _key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Increment the version number for ``name`` and return the new value."""
+
+    key = _key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The counter doesn't exist (yet, or anymore): start a new one
+        cache.add(key, _initial_version(), timeout=None)
+        return cache.incr(key)
+
+
+def stream_and_cache(chunks, key, timeout):
+    """Yield ``chunks`` (strings) and cache their concatenation under ``key``.
+
+    The document is only cached once every chunk has been produced, so
+    an interrupted response never leaves a truncated copy in the cache.
+    """
+
+    sent = []
+    for chunk in chunks:
+        sent.append(chunk)
+        yield chunk
+    cache.set(key, ''.join(sent), timeout)
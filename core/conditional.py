@@ -0,0 +1,77 @@
+"""Conditional GET support (``ETag`` / ``304 Not Modified``) for page views.
+
+``conditional_page(validator)`` wraps a view with Django's ``condition``
+decorator. ``validator(request, *args, **kwargs)`` must be cheap (a
+version number from ``core.cache``, or one small query) and return a
+value that changes whenever the data shown on the page changes, or None
+to skip the check (e.g. when the object doesn't exist). When the
+client's ``If-None-Match`` matches, the view is not called at all.
+
+Pages also show per-visitor parts through ``base.html`` and forms (the
+logged-in state, the cart badge, the CSRF token), so these are part of
+the ``ETag`` too. That is also why no ``Last-Modified`` is sent: a
+modification time of the content can't express a change of visitor
+state (logging in, adding to the cart). Responses are marked
+``Cache-Control: private, no-cache`` so browsers keep them but
+revalidate on every use.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+
+def visitor_state(request):
+    """Return the per-visitor values rendered by the site layout."""
+
+    # Local import: the cart app depends on core, not the other way round
+    from cart.cart import Cart
+
+    user = getattr(request, 'user', None)
+    # The pages embed a CSRF token in their forms. get_token() makes sure the
+    # CSRF cookie is (or will be) set, so the secret it stores is the same
+    # on the visitor's next request and the ETag can match.
+    get_token(request)
+    return (
+        user.pk if user is not None and user.is_authenticated else None,
+        len(Cart(request)),  # Cart badge in the header (read from the stored totals)
+        request.META.get('CSRF_COOKIE', ''),
+    )
+
+
+def make_etag(*parts):
+    """Hash ``parts`` into a (quoted by Django) entity tag."""
+
+    return hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def conditional_page(validator):
+    """Decorate a GET view so unchanged pages are answered with 304."""
+
+    def etag_func(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        version = validator(request, *args, **kwargs)
+        if version is None:
+            return None
+        return make_etag(version, visitor_state(request))
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.has_header('ETag'):
+                # The page depends on cookies (session, cart, CSRF): let browsers
+                # store it privately but always ask whether it is still current
+                patch_cache_control(response, private=True, no_cache=True)
+                patch_vary_headers(response, ('Cookie',))
+            return response
+
+        return wrapper
+
+    return decorator
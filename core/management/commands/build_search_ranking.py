@@ -0,0 +1,29 @@
+"""Build the BM25 ranking index of the search page's "Best matches".
+
+The index (see ``core/search/ranking.py``) is built offline: run this
+periodically (e.g. from cron) and after bulk imports. Web processes
+load the new build on their next search.
+
+Usage:
+    python manage.py build_search_ranking
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.search.ranking import RankingIndex
+
+
+class Command(BaseCommand):
+    help = 'Build the BM25 ranking index of products, posts and categories.'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        index = RankingIndex.build()
+        index.save(str(settings.SEARCH_RANKING_INDEX))
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(index.doc_pk)} document(s) and {len(index.terms)} term(s) '
+            f'in {time.monotonic() - started:.2f}s.'
+        ))
@@ -0,0 +1,25 @@
+"""Rebuild the full-text search index.
+
+Documents are kept up to date on save and delete (see
+``core/signals.py``); run this after the migration creating the index,
+after bulk imports, or after changing what is indexed
+(``core/search/documents.py``).
+
+Usage:
+    python manage.py rebuild_search_index
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.search import fts
+
+
+class Command(BaseCommand):
+    help = 'Recreate the FTS5 search index of products, posts, categories and comments.'
+
+    def handle(self, *args, **options):
+        if not fts.is_available():
+            raise CommandError('The full-text index is not available (SQLite with FTS5 is required).')
+        counts = fts.rebuild_index()
+        summary = ', '.join(f'{count} {name}(s)' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Indexed {summary}.'))
@@ -0,0 +1,25 @@
+"""Recompute the materialized review statistics.
+
+The summary is adjusted whenever a review is saved or deleted (see
+``core/signals.py``); run this after changing reviews in bulk (e.g.
+``QuerySet.update()`` or raw SQL, which send no signals) or to check
+that it has not drifted.
+
+Usage:
+    python manage.py recompute_review_summary
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.models import ReviewSummary
+from core.reviews import invalidate_reviews
+
+
+class Command(BaseCommand):
+    help = 'Recompute the review summary (count, average and star histogram) from the reviews.'
+
+    def handle(self, *args, **options):
+        summary = ReviewSummary.recompute()
+        # The home page caches the summary with the latest reviews
+        invalidate_reviews()
+        self.stdout.write(self.style.SUCCESS(f'Summarized {summary}.'))
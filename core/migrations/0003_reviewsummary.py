@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:00
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def compute_review_summary(apps, schema_editor):
+    # Summarize the existing reviews
+    Review = apps.get_model('core', 'Review')
+    ReviewSummary = apps.get_model('core', 'ReviewSummary')
+    stats = Review.objects.exclude(rating=None).aggregate(
+        count=Count('pk'),
+        total=Sum('rating', default=0),
+        **{f'stars_{stars}': Count('pk', filter=Q(rating=stars)) for stars in range(1, 6)},
+    )
+    ReviewSummary.objects.update_or_create(pk=1, defaults=stats)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('stars_1', models.PositiveIntegerField(default=0)),
+                ('stars_2', models.PositiveIntegerField(default=0)),
+                ('stars_3', models.PositiveIntegerField(default=0)),
+                ('stars_4', models.PositiveIntegerField(default=0)),
+                ('stars_5', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Review summary',
+            },
+        ),
+        migrations.RunPython(compute_review_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Indexes the existing content in the FTS5 table created by 0002, so
+# search works without running the rebuild_search_index command first
+
+from django.db import migrations
+from django.utils.html import strip_tags
+
+# Frozen copy of core.search: rowid = pk * KIND_SLOTS + kind code
+KIND_SLOTS = 8
+BATCH = 500
+
+
+def _slug_words(slug):
+    return slug.replace('-', ' ')
+
+
+def populate_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'core_search_index'")
+        if cursor.fetchone() is None:
+            # SQLite without FTS5: core.search uses its icontains fallback
+            return
+
+    Product = apps.get_model('cart', 'Product')
+    Post = apps.get_model('blog', 'Post')
+    Category = apps.get_model('blog', 'Category')
+    Comment = apps.get_model('blog', 'Comment')
+    # (kind name, code, searchable objects, document), as in core/search/documents.py
+    kinds = [
+        ('product', 1, Product.objects.filter(available=True),
+         lambda product: (product.name, f'{product.description} {_slug_words(product.slug)}')),
+        ('post', 2, Post.objects.filter(published=True),
+         lambda post: (post.title, f'{post.excerpt} {strip_tags(post.content)} {_slug_words(post.slug)}')),
+        ('category', 3, Category.objects.all(),
+         lambda category: (category.name, _slug_words(category.slug))),
+        ('comment', 4, Comment.objects.filter(active=True, post__published=True),
+         lambda comment: (comment.name, comment.content)),
+    ]
+
+    insert = 'INSERT INTO core_search_index (rowid, kind, title, body) VALUES (%s, %s, %s, %s)'
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM core_search_index')
+        for name, code, queryset, document in kinds:
+            rows = []
+            for obj in queryset.order_by('pk').iterator(chunk_size=BATCH):
+                rows.append([obj.pk * KIND_SLOTS + code, name, *document(obj)])
+                if len(rows) >= BATCH:
+                    cursor.executemany(insert, rows)
+                    rows = []
+            if rows:
+                cursor.executemany(insert, rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_reviewsummary'),
+    ]
+
+    operations = [
+        # Reversing leaves the documents in place (0002 drops the table)
+        migrations.RunPython(populate_search_index, migrations.RunPython.noop),
+    ]
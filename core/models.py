@@ -1,14 +1,48 @@
 """Core site models: reviews, contact messages and reservations.
 
 These models back small features used across the site: visitor reviews
-with a star rating, a simple contact message model, and a reservation
-model storing date/time and party size.
+with a star rating and their materialized ``ReviewSummary``, a simple
+contact message model, and a reservation model storing date/time and
+party size. ``LoadedValuesMixin`` is a small helper shared by models of
+other apps.
 """
 
 from django.db import models
+from django.db.models import DEFERRED, Count, F, Q, Sum
 from django.contrib.auth.models import User
 
 
+class LoadedValuesMixin:
+    """Remember the field values a model instance was loaded with.
+
+    Signal handlers use ``get_loaded_values()`` to tell what changed on
+    save (e.g. whether a post was published before) without querying the
+    database again. Instances that were not loaded from the database
+    (new objects) return an empty mapping.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if value is not DEFERRED
+        }
+        return instance
+
+    def get_loaded_values(self):
+        """Return ``{attname: value}`` as last loaded from (or saved to) the database."""
+
+        return getattr(self, '_loaded_values', {})
+
+    def remember_loaded_values(self):
+        """Record the current field values as the stored ones (call after saving)."""
+
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields if field.attname in self.__dict__
+        }
+
+
 # Rating choices used by the Review model. Display strings include
 # stars for readability in the admin and templates.
 RATING = [
@@ -20,7 +54,7 @@ RATING = [
 ]
 
 
-class Review(models.Model):
+class Review(LoadedValuesMixin, models.Model):
     """Customer review with an optional linked user.
 
     Fields
@@ -52,6 +86,93 @@ class Review(models.Model):
         return "No rating"
 
 
+class ReviewSummary(models.Model):
+    """Materialized statistics of all reviews, kept in a single row.
+
+    The home page shows the average rating and the distribution of
+    stars without aggregating the reviews table: saving or deleting a
+    review adjusts this row in the same transaction (see
+    ``core/signals.py``). ``recompute()`` (the ``recompute_review_summary``
+    command) rebuilds it from the reviews.
+
+    Fields
+    - count: number of rated reviews.
+    - total: sum of their ratings (the average is ``total / count``).
+    - stars_1 ... stars_5: number of reviews with each rating.
+    """
+
+    SINGLETON_PK = 1
+
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Review summary"
+
+    def __str__(self):
+        return f"{self.count} reviews, average {self.average or 0:.1f}"
+
+    @classmethod
+    def load(cls):
+        """Return the summary row (one query), or an empty unsaved summary."""
+
+        return cls.objects.filter(pk=cls.SINGLETON_PK).first() or cls(pk=cls.SINGLETON_PK)
+
+    @classmethod
+    def adjust(cls, added=None, removed=None):
+        """Count a review rated ``added`` and uncount one rated ``removed``.
+
+        Either may be None (a new or a deleted review). The row is
+        updated with one UPDATE of relative (``F()``) increments, so
+        concurrent writers never lose each other's changes; it is
+        recomputed from the reviews if it does not exist yet.
+        """
+
+        changes = {}
+        for rating, step in ((added, 1), (removed, -1)):
+            if rating is not None:
+                changes['count'] = changes.get('count', 0) + step
+                changes['total'] = changes.get('total', 0) + step * rating
+                field = f'stars_{rating}'
+                changes[field] = changes.get(field, 0) + step
+        changes = {field: F(field) + change for field, change in changes.items() if change}
+        if changes and not cls.objects.filter(pk=cls.SINGLETON_PK).update(**changes):
+            # The review was already saved (or deleted): recounting includes it
+            cls.recompute()
+
+    @classmethod
+    def recompute(cls):
+        """Rebuild the summary from the reviews table (one aggregate query)."""
+
+        stats = Review.objects.exclude(rating=None).aggregate(
+            count=Count('pk'),
+            total=Sum('rating', default=0),
+            **{f'stars_{stars}': Count('pk', filter=Q(rating=stars)) for stars, _ in RATING},
+        )
+        summary, _ = cls.objects.update_or_create(pk=cls.SINGLETON_PK, defaults=stats)
+        return summary
+
+    @property
+    def average(self):
+        """Average rating, or None without reviews."""
+
+        return self.total / self.count if self.count else None
+
+    def histogram(self):
+        """Return ``[(stars, count, percent), ...]`` from 5 stars down to 1."""
+
+        return [
+            (stars, getattr(self, f'stars_{stars}'),
+             round(100 * getattr(self, f'stars_{stars}') / self.count) if self.count else 0)
+            for stars in range(5, 0, -1)
+        ]
+
+
 class Contact(models.Model):
     """Simple contact message submitted by a visitor."""
 
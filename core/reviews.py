@@ -0,0 +1,81 @@
+"""Cached review data of the home page.
+
+The home page shows the latest reviews with their authors, the rating
+summary and, to a logged-in visitor, their own review (to prefill the
+review form). All of it changes only when a review is written, so:
+
+- ``get_home_reviews()`` returns a snapshot of the latest reviews (with
+  the authors' usernames joined in the same query) and the
+  ``ReviewSummary`` row, cached as one entry;
+- ``get_user_review(user)`` returns the visitor's review, cached per
+  user (one query per user, including users without a review).
+
+Both are keyed by the ``reviews`` version of ``core.cache``, bumped
+when a review is saved or deleted and when a user is renamed or deleted
+(see ``core/signals.py``).
+"""
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache import bump_version, get_version
+from .models import Review, ReviewSummary
+
+REVIEWS_VERSION = 'reviews'
+
+# Reviews shown on the home page
+HOME_REVIEWS = 3
+
+# How long cached review data is kept (it is also invalidated on change)
+REVIEWS_CACHE_TIMEOUT = 60 * 60
+
+# Cached for users without a review (None means "not cached")
+_NO_REVIEW = 'none'
+
+
+class HomeReviews:
+    """Snapshot of the home page's review data.
+
+    - reviews: the ``HOME_REVIEWS`` latest reviews, with ``user`` loaded
+      (only its username)
+    - summary: the ``ReviewSummary`` row
+    """
+
+    def __init__(self, reviews, summary):
+        self.reviews = reviews
+        self.summary = summary
+
+
+def get_home_reviews():
+    """Return the cached ``HomeReviews``, loading it (two queries) if needed."""
+
+    key = f'core:home_reviews:{get_version(REVIEWS_VERSION)}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        reviews = list(
+            Review.objects.select_related('user')
+            .only('review', 'rating', 'date', 'user__username')
+            .order_by('-date')[:HOME_REVIEWS]
+        )
+        snapshot = HomeReviews(reviews, ReviewSummary.load())
+        cache.set(key, snapshot, REVIEWS_CACHE_TIMEOUT)
+    return snapshot
+
+
+def get_user_review(user):
+    """Return ``user``'s review (None if they have none or are anonymous)."""
+
+    if not user.is_authenticated:
+        return None
+    key = f'core:user_review:{get_version(REVIEWS_VERSION)}:{user.pk}'
+    review = cache.get(key)
+    if review is None:
+        review = Review.objects.filter(user=user).only('review', 'rating', 'user').first() or _NO_REVIEW
+        cache.set(key, review, REVIEWS_CACHE_TIMEOUT)
+    return review if isinstance(review, Review) else None
+
+
+def invalidate_reviews():
+    """Drop the cached review data once the current transaction commits."""
+
+    transaction.on_commit(lambda: bump_version(REVIEWS_VERSION))
@@ -0,0 +1,142 @@
+"""Site search across products, blog posts, categories and comments.
+
+``search_kind()`` returns the best matches of one kind of content as
+``Hit`` objects (primary key plus highlighted title/snippet) and
+``hydrate()`` loads the matching objects with one query.
+``search_page()`` combines them into one bounded ``ResultPage`` of a
+kind, with a match count capped at ``COUNT_CAP``; its hits are kept in
+the in-process cache of ``core.search.cache``. Matching uses
+the SQLite FTS5 index of ``core.search.fts`` when it exists, and plain
+``icontains`` lookups otherwise.
+
+What is indexed for each model is described in ``core.search.documents``.
+"""
+
+from functools import reduce
+from math import ceil
+from operator import or_
+
+from django.db.models import Q
+
+from . import fts
+from .documents import KINDS, KINDS_BY_MODEL, KINDS_BY_NAME
+from .cache import get_search_cache, normalize_query
+from .fts import Hit
+
+# Results shown per page of each kind
+RESULTS_PER_PAGE = 8
+
+# Matches counted at most per kind. Past it the count is shown as "100+"
+# and no further pages are served, which bounds the cost of a search
+# whatever the size of the tables.
+COUNT_CAP = 100
+
+
+def _fallback_matches(query, kind):
+    # Without the index: icontains over the kind's text fields, in model order
+    condition = reduce(or_, (Q(**{f'{field}__icontains': query}) for field in kind.fields))
+    return kind.get_queryset().filter(condition).order_by('pk').values_list('pk', flat=True)
+
+
+def _fallback_search(query, kind, limit, offset):
+    pks = _fallback_matches(query, kind)
+    pks = pks[offset:offset + limit] if limit is not None else pks[offset:]
+    return [Hit(pk) for pk in pks]
+
+
+def _kind(kind):
+    return KINDS_BY_NAME[kind] if isinstance(kind, str) else kind
+
+
+def search_kind(query, kind, limit=None, offset=0):
+    """Return up to ``limit`` hits of ``kind`` (a ``Kind`` or its name), best first."""
+
+    kind = _kind(kind)
+    if fts.is_available():
+        return fts.search(query, kind, limit, offset)
+    return _fallback_search(query, kind, limit, offset)
+
+
+def count_kind(query, kind, limit):
+    """Return the number of matches of ``kind``, counting at most ``limit``."""
+
+    kind = _kind(kind)
+    if fts.is_available():
+        return fts.count(query, kind, limit)
+    # A sliced queryset is counted with a LIMIT subquery
+    return _fallback_matches(query, kind)[:limit].count()
+
+
+def hydrate(kind, hits):
+    """Load the objects of ``hits`` in order, with one query.
+
+    Each object gets ``search_title`` and ``search_snippet`` attributes
+    (highlighted HTML, or None without the full-text index). Hits whose
+    object disappeared or stopped being searchable in the meantime (e.g.
+    a comment of a post that was unpublished) are skipped.
+    """
+
+    kind = _kind(kind)
+    if not hits:
+        return []
+    objects = kind.model.objects.select_related(*kind.select_related).in_bulk([hit.pk for hit in hits])
+    results = []
+    for hit in hits:
+        obj = objects.get(hit.pk)
+        if obj is not None and kind.is_searchable(obj):
+            obj.search_title = hit.title
+            obj.search_snippet = hit.snippet
+            results.append(obj)
+    return results
+
+
+class ResultPage:
+    """One page of search results of a kind.
+
+    ``count`` is the number of matches up to ``COUNT_CAP``; ``capped``
+    tells that there are more than that.
+    """
+
+    def __init__(self, kind, results, number, count, capped, per_page):
+        self.kind = kind
+        self.results = results
+        self.number = number
+        self.count = count
+        self.capped = capped
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.number * self.per_page < self.count
+
+    @property
+    def has_previous(self):
+        return self.number > 1
+
+
+def _page_hits(query, kind, page, per_page, cap):
+    # (hits, page number, count, capped) of one page, without loading objects
+    count = count_kind(query, kind, cap + 1)
+    capped = count > cap
+    count = min(count, cap)
+    number = min(max(page, 1), max(1, ceil(count / per_page)))
+    offset = (number - 1) * per_page
+    # The last page stops at the cap
+    hits = search_kind(query, kind, limit=min(per_page, count - offset), offset=offset) if count else []
+    return hits, number, count, capped
+
+
+def search_page(query, kind, page=1, per_page=RESULTS_PER_PAGE, cap=COUNT_CAP):
+    """Return page ``page`` (1-based, clamped to the pages within ``cap``) of ``kind``'s results.
+
+    The hits come from the search cache when the same (normalized) query
+    was searched recently; the objects are always loaded fresh.
+    """
+
+    kind = _kind(kind)
+    query = normalize_query(query)
+    hits, number, count, capped = get_search_cache().get_or_compute(
+        (query, kind.name, page, per_page, cap),
+        lambda: _page_hits(query, kind, page, per_page, cap),
+    )
+    return ResultPage(kind, hydrate(kind, hits), number, count, capped, per_page)
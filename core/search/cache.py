@@ -0,0 +1,138 @@
+"""In-process cache of search results.
+
+Popular queries are searched over and over with identical results.
+``SearchCache`` keeps the results of recent searches in memory, per
+worker process: a bounded LRU of ``SEARCH_CACHE_SIZE`` entries, each
+expiring after ``SEARCH_CACHE_TIMEOUT`` seconds.
+
+Entries are keyed by the normalized query (case-folded, whitespace
+collapsed, see ``normalize_query``) and hold only primary keys and the
+highlighted text of the hits, never model instances: the objects are
+loaded again (one query per kind) on every search, so a cached page
+always shows current prices, titles and images.
+
+All entries belong to a generation, the ``search`` version of
+``core.cache``. Saving or deleting a ``Product``, ``Post``, ``Category``
+or ``Comment`` bumps it (see ``core/signals.py``) once the transaction
+commits, which empties the cache of every process on its next lookup.
+Bumping earlier would let a search run before the commit store the old
+results under the new generation.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from core.cache import bump_version, get_version
+
+SEARCH_VERSION = 'search'
+
+
+def normalize_query(query):
+    """Return ``query`` case-folded with its whitespace collapsed."""
+
+    return ' '.join(query.casefold().split())
+
+
+class SearchCache:
+    """Thread-safe LRU cache whose entries expire after ``timeout`` seconds."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._entries = OrderedDict()  # key -> (expiry time, value), oldest first
+        self._generation = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _check_generation(self):
+        # Drop every entry when the content changed (called with the lock held)
+        generation = get_version(SEARCH_VERSION)
+        if generation != self._generation:
+            if self._entries:
+                self._invalidations += 1
+            self._entries.clear()
+            self._generation = generation
+
+    def get_or_compute(self, key, compute):
+        """Return the value cached for ``key``, calling ``compute()`` on a miss."""
+
+        now = time.monotonic()
+        with self._lock:
+            self._check_generation()
+            generation = self._generation
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return value
+                del self._entries[key]
+                self._expired += 1
+            self._misses += 1
+
+        # Computed without the lock so searches don't wait on each other
+        value = compute()
+
+        with self._lock:
+            # Don't store results computed while the content changed
+            if self._generation == generation:
+                self._entries[key] = (time.monotonic() + self.timeout, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return the cache's counters (for the stats endpoint)."""
+
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.size,
+                'timeout': self.timeout,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': self._hits / lookups if lookups else None,
+                'expired': self._expired,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    """Return this process's search cache, creating it on first use."""
+
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SearchCache(settings.SEARCH_CACHE_SIZE, settings.SEARCH_CACHE_TIMEOUT)
+    return _cache
+
+
+def invalidate_search_cache():
+    """Start a new generation once the current transaction commits.
+
+    Every process then drops its cached results.
+    """
+
+    transaction.on_commit(lambda: bump_version(SEARCH_VERSION))
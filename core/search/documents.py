@@ -0,0 +1,98 @@
+"""What the site search indexes.
+
+Each searchable model is described by a ``Kind``: how to turn an object
+into a search document (a short ``title`` and a longer ``body``), which
+objects are searchable at all (published posts, active comments...) and
+the queryset to index when rebuilding. ``KINDS`` lists them in the order
+results are shown.
+"""
+
+from django.utils.html import strip_tags
+
+from blog.models import Category, Comment, Post
+from cart.models import Product
+
+
+def _slug_words(slug):
+    return slug.replace('-', ' ')
+
+
+class Kind:
+    """A searchable model.
+
+    ``code`` is a small integer identifying the kind inside the search
+    index (it must never change once documents are indexed).
+    ``select_related`` lists relations the result templates use.
+    """
+
+    def __init__(self, name, code, model, title, body, fields, is_searchable=None,
+                 queryset=None, select_related=()):
+        self.name = name
+        self.code = code
+        self.model = model
+        self.title = title
+        self.body = body
+        # Text fields searched with icontains when the index is unavailable
+        self.fields = fields
+        self._is_searchable = is_searchable
+        self._queryset = queryset
+        self.select_related = select_related
+
+    def is_searchable(self, obj):
+        """Whether ``obj`` may appear in search results."""
+
+        return self._is_searchable is None or self._is_searchable(obj)
+
+    def get_queryset(self):
+        """All searchable objects of this kind."""
+
+        if self._queryset is not None:
+            return self._queryset()
+        return self.model.objects.all()
+
+    def document(self, obj):
+        """Return the ``(title, body)`` text indexed for ``obj``."""
+
+        return self.title(obj), self.body(obj)
+
+    def __repr__(self):
+        return f'<Kind {self.name}>'
+
+
+KINDS = [
+    Kind(
+        'product', 1, Product,
+        title=lambda product: product.name,
+        body=lambda product: f'{product.description} {_slug_words(product.slug)}',
+        fields=('name', 'description', 'slug'),
+        is_searchable=lambda product: product.available,
+        queryset=lambda: Product.objects.filter(available=True),
+    ),
+    Kind(
+        'post', 2, Post,
+        title=lambda post: post.title,
+        body=lambda post: f'{post.excerpt} {strip_tags(post.content)} {_slug_words(post.slug)}',
+        fields=('title', 'content', 'excerpt', 'slug'),
+        is_searchable=lambda post: post.published,
+        queryset=lambda: Post.objects.filter(published=True),
+    ),
+    Kind(
+        'category', 3, Category,
+        title=lambda category: category.name,
+        body=lambda category: _slug_words(category.slug),
+        fields=('name', 'slug'),
+    ),
+    Kind(
+        # Commenter e-mail addresses are deliberately not searchable
+        'comment', 4, Comment,
+        title=lambda comment: comment.name,
+        body=lambda comment: comment.content,
+        fields=('name', 'content'),
+        is_searchable=lambda comment: comment.active and comment.post.published,
+        queryset=lambda: Comment.objects.filter(active=True, post__published=True).select_related('post'),
+        select_related=('post',),
+    ),
+]
+
+KINDS_BY_NAME = {kind.name: kind for kind in KINDS}
+KINDS_BY_MODEL = {kind.model: kind for kind in KINDS}
@@ -0,0 +1,82 @@
+"""Run the sources of a search concurrently, each with a timeout.
+
+The search page combines several independent lookups (the results of
+each kind and the merged ranking). ``gather_sources()`` runs them at
+the same time in a bounded pool of ``SEARCH_WORKERS`` threads, so the
+page waits for the slowest lookup instead of the sum of all of them.
+A lookup not finished after ``SEARCH_SOURCE_TIMEOUT`` seconds (or that
+fails) is reported as unavailable and the page is shown without it.
+
+A timed-out lookup cannot be interrupted: it keeps its worker thread
+until it finishes and its result is discarded. The pool size bounds how
+many such lookups (and database connections) can pile up.
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# Result of a lookup that timed out or failed
+_UNAVAILABLE = object()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_search_executor():
+    """Return the thread pool running the search lookups (created on first use)."""
+
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.SEARCH_WORKERS, thread_name_prefix='search')
+    return _executor
+
+
+def _run_in_worker(lookup):
+    # Like a request, a lookup starts and ends by closing the worker's
+    # database connection if it is unusable or past CONN_MAX_AGE
+    close_old_connections()
+    try:
+        return lookup()
+    finally:
+        close_old_connections()
+
+
+async def _run_source(name, lookup, timeout):
+    run = sync_to_async(_run_in_worker, thread_sensitive=False, executor=get_search_executor())
+    try:
+        return await asyncio.wait_for(run(lookup), timeout)
+    except asyncio.TimeoutError:
+        logger.warning('Search source %r timed out after %ss', name, timeout)
+    except Exception:
+        logger.exception('Search source %r failed', name)
+    return _UNAVAILABLE
+
+
+async def gather_sources(lookups, timeout=None):
+    """Run ``{name: callable}`` concurrently.
+
+    Returns ``(results, unavailable)``: the results of the lookups that
+    finished in time by name, and the names of those that did not.
+    """
+
+    if timeout is None:
+        timeout = settings.SEARCH_SOURCE_TIMEOUT
+    names = list(lookups)
+    outcomes = await asyncio.gather(*(_run_source(name, lookups[name], timeout) for name in names))
+    results, unavailable = {}, []
+    for name, outcome in zip(names, outcomes):
+        if outcome is _UNAVAILABLE:
+            unavailable.append(name)
+        else:
+            results[name] = outcome
+    return results, unavailable
@@ -0,0 +1,208 @@
+"""SQLite FTS5 full-text index of the searchable content.
+
+All kinds share one FTS5 virtual table (created by the
+``core.0002_search_index`` migration and filled with the existing
+content by ``core.0004_populate_search_index``)::
+
+    core_search_index(kind UNINDEXED, title, body)
+
+The ``rowid`` of a document encodes its kind and primary key
+(``pk * KIND_SLOTS + kind.code``), so a single object is updated or
+removed by rowid without scanning the index. Documents are kept in sync
+by the signal handlers in ``core/signals.py``; ``rebuild_index()`` (the
+``rebuild_search_index`` command) recreates them all.
+
+Queries are run as ``MATCH`` expressions in which every word is a
+prefix (``"esp"*``), so results appear while a word is being typed.
+Results are ordered by ``bm25()`` relevance with title matches weighing
+more than body matches, and come with highlighted titles and snippets.
+
+On databases without FTS5 ``is_available()`` is False and callers fall
+back to ``icontains`` lookups (see ``core.search``).
+"""
+
+import re
+
+from django.db import DatabaseError, connection, transaction
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .documents import KINDS, KINDS_BY_MODEL
+
+TABLE = 'core_search_index'
+
+# Number of rowids reserved per primary key (one per kind code)
+KIND_SLOTS = 8
+
+# bm25() weights of the table's columns: kind (unindexed), title, body
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+# Words around the matches in a snippet
+SNIPPET_WORDS = 16
+
+# Rows inserted per statement when rebuilding
+REBUILD_BATCH = 500
+
+# Highlight markers put in the text by SQLite and turned into <mark>
+# elements after HTML-escaping the text
+_OPEN, _CLOSE = '\x02', '\x03'
+
+_WORD_RE = re.compile(r'\w+')
+
+_available = None
+
+
+def is_available():
+    """Whether the FTS5 index exists in the database (checked once per process)."""
+
+    global _available
+    if _available is None:
+        if connection.vendor != 'sqlite':
+            _available = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLE])
+                _available = cursor.fetchone() is not None
+    return _available
+
+
+def rowid_for(kind, pk):
+    return pk * KIND_SLOTS + kind.code
+
+
+def pk_from_rowid(rowid):
+    return rowid // KIND_SLOTS
+
+
+def index_objects(objects):
+    """Add, update or remove the documents of ``objects`` (any searchable models).
+
+    Objects that are not searchable (e.g. unpublished posts) are removed.
+    """
+
+    if not is_available():
+        return
+    deletes, inserts = [], []
+    for obj in objects:
+        kind = KINDS_BY_MODEL[type(obj)]
+        rowid = rowid_for(kind, obj.pk)
+        deletes.append([rowid])
+        if kind.is_searchable(obj):
+            inserts.append([rowid, kind.name, *kind.document(obj)])
+    with transaction.atomic(), connection.cursor() as cursor:
+        if deletes:
+            cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', deletes)
+        if inserts:
+            cursor.executemany(f'INSERT INTO {TABLE} (rowid, kind, title, body) VALUES (%s, %s, %s, %s)', inserts)
+
+
+def index_object(obj):
+    """Add, update or remove the document of one object."""
+
+    index_objects([obj])
+
+
+def remove_documents(kind, pks):
+    """Remove the documents of the objects of ``kind`` with the given primary keys."""
+
+    if not is_available() or not pks:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [[rowid_for(kind, pk)] for pk in pks])
+
+
+def remove_object(obj):
+    """Remove the document of a deleted object."""
+
+    remove_documents(KINDS_BY_MODEL[type(obj)], [obj.pk])
+
+
+def rebuild_index():
+    """Recreate every document of the index. Returns ``{kind name: count}``."""
+
+    if not is_available():
+        raise DatabaseError(f'The {TABLE} FTS5 table does not exist.')
+    counts = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        for kind in KINDS:
+            rows, counts[kind.name] = [], 0
+            for obj in kind.get_queryset().order_by('pk').iterator(chunk_size=REBUILD_BATCH):
+                rows.append([rowid_for(kind, obj.pk), kind.name, *kind.document(obj)])
+                if len(rows) >= REBUILD_BATCH:
+                    cursor.executemany(f'INSERT INTO {TABLE} (rowid, kind, title, body) VALUES (%s, %s, %s, %s)', rows)
+                    counts[kind.name] += len(rows)
+                    rows = []
+            if rows:
+                cursor.executemany(f'INSERT INTO {TABLE} (rowid, kind, title, body) VALUES (%s, %s, %s, %s)', rows)
+                counts[kind.name] += len(rows)
+        # Merge the index segments written by the rebuild
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return counts
+
+
+def match_expression(query):
+    """Turn a user query into an FTS5 ``MATCH`` expression, or None if empty.
+
+    Every word becomes a quoted prefix term (so FTS5 operators and
+    punctuation typed by users are never interpreted); all words must
+    match.
+    """
+
+    words = _WORD_RE.findall(query.lower())
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _highlighted(text):
+    # HTML-escape the text, then turn the markers into <mark> elements
+    return mark_safe(escape(text).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>'))
+
+
+class Hit:
+    """One search result: the object's primary key and highlighted text."""
+
+    __slots__ = ('pk', 'title', 'snippet')
+
+    def __init__(self, pk, title=None, snippet=None):
+        self.pk = pk
+        self.title = title
+        self.snippet = snippet
+
+
+def count(query, kind, limit):
+    """Count the matches of one kind, stopping at ``limit``."""
+
+    match = match_expression(query)
+    if match is None:
+        return 0
+    sql = f'SELECT count(*) FROM (SELECT 1 FROM {TABLE} WHERE {TABLE} MATCH %s AND kind = %s LIMIT %s)'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, kind.name, limit])
+        return cursor.fetchone()[0]
+
+
+def search(query, kind, limit=None, offset=0):
+    """Return the best matching ``Hit`` objects of one kind, best first."""
+
+    match = match_expression(query)
+    if match is None:
+        return []
+    sql = (
+        f'SELECT rowid, highlight({TABLE}, 1, %s, %s), '
+        f"snippet({TABLE}, 2, %s, %s, '…', %s) "
+        f'FROM {TABLE} WHERE {TABLE} MATCH %s AND kind = %s '
+        f'ORDER BY bm25({TABLE}, 0.0, %s, %s) LIMIT %s OFFSET %s'
+    )
+    params = [
+        _OPEN, _CLOSE, _OPEN, _CLOSE, SNIPPET_WORDS, match, kind.name,
+        TITLE_WEIGHT, BODY_WEIGHT, -1 if limit is None else limit, offset,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            Hit(pk_from_rowid(rowid), _highlighted(title), _highlighted(snippet))
+            for rowid, title, snippet in cursor.fetchall()
+        ]
@@ -0,0 +1,231 @@
+"""BM25 ranking of products, posts and categories in one merged list.
+
+The per-kind sections of the search page are ranked within each kind
+by the full-text index. To list the best matches of all kinds together,
+``RankingIndex`` scores documents with BM25F (BM25 over several fields):
+every field's term frequency is normalized by the field's length and
+multiplied by its boost (title words weigh ``TITLE_BOOST`` times, body
+words ``BODY_BOOST`` times), the sum is saturated with ``K1`` and
+weighted by the term's inverse document frequency.
+
+The index is built offline by the ``build_search_ranking`` command and
+saved as compressed NumPy arrays (``SEARCH_RANKING_INDEX``):
+
+- ``terms``: the sorted vocabulary;
+- ``indptr``: postings of ``terms[i]`` are ``indptr[i]:indptr[i + 1]``;
+- ``post_doc``, ``post_title_tf``, ``post_body_tf``: one entry per
+  (term, document) pair: the document and the term's count per field;
+- ``doc_kind``, ``doc_pk``, ``title_len``, ``body_len``: per document.
+
+Because the vocabulary is sorted, every term starting with a query word
+is a contiguous range of ``terms`` and its postings a contiguous slice
+of the posting arrays, so a query word is scored with a handful of
+vectorized operations whatever its number of matching documents.
+
+Objects created after the last build are not ranked until the next one;
+deleted or unpublished ones are skipped when the results are loaded.
+"""
+
+import os
+import re
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+
+from . import hydrate
+from .cache import get_search_cache, normalize_query
+from .documents import KINDS_BY_NAME
+from .fts import Hit
+
+# Kinds ranked together
+RANKED_KINDS = ('product', 'post', 'category')
+KIND_NAMES_BY_CODE = {KINDS_BY_NAME[kind_name].code: kind_name for kind_name in RANKED_KINDS}
+
+# BM25 parameters: term frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+
+# Field boosts (a title word counts as TITLE_BOOST body words)
+TITLE_BOOST = 5.0
+BODY_BOOST = 1.0
+
+# Results in the merged list
+TOP_RESULTS = 10
+
+# Longer words (URLs, hashes...) are not indexed: the vocabulary array's
+# width is its longest term
+MAX_TERM_LENGTH = 40
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [word for word in _WORD_RE.findall(text.casefold()) if len(word) <= MAX_TERM_LENGTH]
+
+
+class RankingIndex:
+    """BM25F index loaded from (or about to be saved to) NumPy arrays."""
+
+    def __init__(self, arrays, stamp=None):
+        self.arrays = arrays
+        # Identifies the build (file modification time), for caching
+        self.stamp = stamp
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+        # Length normalization of each field, per document
+        self.title_norm = self._length_norm(self.title_len)
+        self.body_norm = self._length_norm(self.body_len)
+
+    @staticmethod
+    def _length_norm(lengths):
+        average = lengths.mean() if len(lengths) else 0
+        if not average:
+            return np.ones(len(lengths))
+        return 1.0 - B + B * lengths / average
+
+    @classmethod
+    def build(cls):
+        """Build the index of every searchable object of ``RANKED_KINDS``."""
+
+        postings = {}
+        doc_kind, doc_pk, title_len, body_len = [], [], [], []
+        for kind_name in RANKED_KINDS:
+            kind = KINDS_BY_NAME[kind_name]
+            for obj in kind.get_queryset().order_by('pk').iterator(chunk_size=500):
+                title, body = (tokenize(text) for text in kind.document(obj))
+                doc = len(doc_pk)
+                doc_kind.append(kind.code)
+                doc_pk.append(obj.pk)
+                title_len.append(len(title))
+                body_len.append(len(body))
+                title_counts, body_counts = Counter(title), Counter(body)
+                for term in title_counts.keys() | body_counts.keys():
+                    postings.setdefault(term, []).append((doc, title_counts[term], body_counts[term]))
+
+        terms = sorted(postings)
+        entries = [entry for term in terms for entry in postings[term]]
+        counts = np.array([entry[1:] for entry in entries], dtype=np.uint32).reshape(-1, 2)
+        return cls({
+            'terms': np.array(terms, dtype=str),
+            'indptr': np.cumsum([0] + [len(postings[term]) for term in terms], dtype=np.int64),
+            'post_doc': np.array([entry[0] for entry in entries], dtype=np.int32),
+            # Counts are capped to fit in 16 bits (saturation makes the rest moot)
+            'post_title_tf': np.minimum(counts[:, 0], 65535).astype(np.uint16),
+            'post_body_tf': np.minimum(counts[:, 1], 65535).astype(np.uint16),
+            'doc_kind': np.array(doc_kind, dtype=np.uint8),
+            'doc_pk': np.array(doc_pk, dtype=np.int64),
+            'title_len': np.array(title_len, dtype=np.uint32),
+            'body_len': np.array(body_len, dtype=np.uint32),
+        })
+
+    def save(self, path):
+        """Write the arrays to ``path`` (atomically replacing any previous build)."""
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as file:
+            np.savez_compressed(file, **self.arrays)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        stamp = os.stat(path).st_mtime_ns
+        with np.load(path, allow_pickle=False) as data:
+            return cls({name: data[name] for name in data.files}, stamp)
+
+    def _term_range(self, word):
+        # Terms starting with ``word``: a contiguous range of the sorted vocabulary
+        low = np.searchsorted(self.terms, word, side='left')
+        high = np.searchsorted(self.terms, word + '\U0010ffff', side='left')
+        return low, high
+
+    def score(self, query):
+        """Return the BM25F score of every document for ``query``.
+
+        Every query word matches the terms it is a prefix of, counted as
+        one term: its frequencies in a document are summed and its
+        document frequency is the number of documents with any of them.
+        """
+
+        documents = len(self.doc_pk)
+        scores = np.zeros(documents)
+        for word in set(tokenize(query)):
+            low, high = self._term_range(word)
+            start, end = self.indptr[low], self.indptr[high]
+            if start == end:
+                continue
+            docs = self.post_doc[start:end]
+            title_tf = np.bincount(docs, weights=self.post_title_tf[start:end], minlength=documents)
+            body_tf = np.bincount(docs, weights=self.post_body_tf[start:end], minlength=documents)
+            matching = np.unique(docs)
+            frequency = (
+                TITLE_BOOST * title_tf[matching] / self.title_norm[matching]
+                + BODY_BOOST * body_tf[matching] / self.body_norm[matching]
+            )
+            idf = np.log(1.0 + (documents - len(matching) + 0.5) / (len(matching) + 0.5))
+            scores[matching] += idf * frequency * (K1 + 1) / (K1 + frequency)
+        return scores
+
+    def top(self, query, limit=TOP_RESULTS):
+        """Return the ``limit`` best ``(kind name, pk, score)``, best first."""
+
+        scores = self.score(query)
+        matching = np.flatnonzero(scores)
+        if len(matching) > limit:
+            matching = matching[np.argpartition(-scores[matching], limit - 1)[:limit]]
+        matching = matching[np.argsort(-scores[matching], kind='stable')]
+        return [
+            (KIND_NAMES_BY_CODE[int(self.doc_kind[doc])], int(self.doc_pk[doc]), float(scores[doc]))
+            for doc in matching
+        ]
+
+_index = None
+
+
+def get_ranking_index():
+    """Return the saved index, reloading it after a new build; None if never built."""
+
+    global _index
+    path = str(settings.SEARCH_RANKING_INDEX)
+    try:
+        stamp = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    index = _index
+    if index is None or index.stamp != stamp:
+        index = _index = RankingIndex.load(path)
+    return index
+
+
+def ranked_search(query, limit=TOP_RESULTS):
+    """Return the best matching products, posts and categories, best first.
+
+    Each object gets ``search_type`` (its kind name) and ``search_score``
+    attributes. Returns an empty list until the index has been built.
+    """
+
+    index = get_ranking_index()
+    if index is None:
+        return []
+    query = normalize_query(query)
+    ranked = get_search_cache().get_or_compute(
+        (query, 'ranked', limit, index.stamp),
+        lambda: index.top(query, limit),
+    )
+
+    # Load the objects with one query per kind, then restore the ranking
+    loaded = {}
+    for kind_name in RANKED_KINDS:
+        hits = [Hit(pk) for name, pk, _ in ranked if name == kind_name]
+        for obj in hydrate(kind_name, hits):
+            loaded[(kind_name, obj.pk)] = obj
+    results = []
+    for kind_name, pk, score in ranked:
+        obj = loaded.get((kind_name, pk))
+        if obj is not None:
+            obj.search_type = kind_name
+            obj.search_score = score
+            results.append(obj)
+    return results
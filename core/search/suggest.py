@@ -0,0 +1,185 @@
+"""In-memory prefix index for search-as-you-type suggestions.
+
+Suggestions complete what is typed in the search box with the names of
+available products, the titles of published posts and the names of
+categories. They are answered from memory, without any query, by
+``SuggestIndex``: sorted arrays of normalized names searched with
+``bisect``, so a lookup costs a binary search plus a scan of the
+``limit`` first completions.
+
+Two arrays are kept: the whole names, and the names starting at each of
+their later words ("brew" suggests "Cold brew"). Whole-name matches are
+suggested first.
+
+Each worker process builds its index on first use (one query per model)
+and updates it in place when it saves or deletes a suggested object
+(see ``core/signals.py``) once the transaction commits. Changes made by other processes bump the
+``search:suggest`` version of ``core.cache``; a process seeing a newer
+version than its index rebuilds it on its next lookup.
+"""
+
+import threading
+from bisect import bisect_left, insort
+
+from django.db import transaction
+
+from core.cache import bump_version, get_version
+
+from .cache import normalize_query
+from .documents import KINDS_BY_NAME
+
+SUGGEST_VERSION = 'search:suggest'
+
+# Suggestions returned by a lookup
+SUGGEST_LIMIT = 8
+
+# Kinds suggested and the field completed, in the order they are listed
+SOURCES = (('product', 'name'), ('post', 'title'), ('category', 'name'))
+SOURCE_FIELDS = dict(SOURCES)
+SOURCE_MODELS = {KINDS_BY_NAME[kind_name].model: kind_name for kind_name, _ in SOURCES}
+
+
+def _keys(label):
+    # (whole name, [name from each later word]) normalized for lookups
+    name = normalize_query(label)
+    words = name.split(' ')
+    return name, [' '.join(words[start:]) for start in range(1, len(words))]
+
+
+class SuggestIndex:
+    """Sorted-array prefix index of the suggested names.
+
+    ``_names`` and ``_words`` are sorted lists of ``(key, kind name, pk)``
+    tuples; ``_entries`` maps ``(kind name, pk)`` to the suggestion
+    returned to clients.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self._names = []
+        self._words = []
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_database(cls, version):
+        index = cls(version)
+        for kind_name, field in SOURCES:
+            kind = KINDS_BY_NAME[kind_name]
+            for obj in kind.get_queryset().only(field, 'slug').iterator():
+                index._add(kind_name, obj)
+        index._names.sort()
+        index._words.sort()
+        return index
+
+    def _add(self, kind_name, obj, keep_sorted=False):
+        label = getattr(obj, SOURCE_FIELDS[kind_name])
+        self._entries[(kind_name, obj.pk)] = {
+            'label': label, 'url': obj.get_absolute_url(), 'type': kind_name,
+        }
+        name, word_keys = _keys(label)
+        add = insort if keep_sorted else list.append
+        add(self._names, (name, kind_name, obj.pk))
+        for key in word_keys:
+            add(self._words, (key, kind_name, obj.pk))
+
+    def _remove(self, kind_name, pk):
+        entry = self._entries.pop((kind_name, pk), None)
+        if entry is None:
+            return
+        name, word_keys = _keys(entry['label'])
+        for array, keys in ((self._names, [name]), (self._words, word_keys)):
+            for key in keys:
+                item = (key, kind_name, pk)
+                position = bisect_left(array, item)
+                if position < len(array) and array[position] == item:
+                    del array[position]
+
+    def update(self, kind_name, obj):
+        """Add, rename or remove (if no longer searchable) one object."""
+
+        with self._lock:
+            self._remove(kind_name, obj.pk)
+            if KINDS_BY_NAME[kind_name].is_searchable(obj):
+                self._add(kind_name, obj, keep_sorted=True)
+
+    def remove(self, kind_name, pks):
+        """Remove deleted objects."""
+
+        with self._lock:
+            for pk in pks:
+                self._remove(kind_name, pk)
+
+    def lookup(self, prefix, limit=SUGGEST_LIMIT):
+        """Return up to ``limit`` suggestions completing ``prefix``."""
+
+        prefix = normalize_query(prefix)
+        if not prefix:
+            return []
+        found, seen = [], set()
+        with self._lock:
+            for array in (self._names, self._words):
+                position = bisect_left(array, (prefix,))
+                while position < len(array) and len(found) < limit:
+                    key, kind_name, pk = array[position]
+                    if not key.startswith(prefix):
+                        break
+                    if (kind_name, pk) not in seen:
+                        seen.add((kind_name, pk))
+                        found.append(self._entries[(kind_name, pk)])
+                    position += 1
+        return found
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_suggest_index():
+    """Return this process's up-to-date index, rebuilding it if stale."""
+
+    global _index
+    version = get_version(SUGGEST_VERSION)
+    index = _index
+    if index is None or index.version != version:
+        with _index_lock:
+            index = _index
+            if index is None or index.version != version:
+                index = _index = SuggestIndex.from_database(version)
+    return index
+
+
+def suggest(prefix, limit=SUGGEST_LIMIT):
+    """Return up to ``limit`` suggestions (label, url, type) completing ``prefix``."""
+
+    return get_suggest_index().lookup(prefix, limit)
+
+
+def _changed(apply):
+    # Tell other processes to rebuild, and apply the change in place to
+    # this process's index if no other change happened in between
+    index = _index
+    previous = get_version(SUGGEST_VERSION)
+    version = bump_version(SUGGEST_VERSION)
+    if index is not None and index.version == previous and version == previous + 1:
+        apply(index)
+        index.version = version
+
+
+def update_suggestions(obj):
+    """Refresh the suggestion of a saved object (if its kind is suggested)."""
+
+    kind_name = SOURCE_MODELS.get(type(obj))
+    if kind_name is not None:
+        transaction.on_commit(lambda: _changed(lambda index: index.update(kind_name, obj)))
+
+
+def remove_suggestions(kind_name, pks):
+    """Remove the suggestions of deleted objects of ``kind_name``."""
+
+    if kind_name in SOURCE_FIELDS and pks:
+        transaction.on_commit(lambda: _changed(lambda index: index.remove(kind_name, pks)))
+
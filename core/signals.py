@@ -0,0 +1,109 @@
+"""Signal handlers for the core app.
+
+Connected in ``CoreConfig.ready()``. They keep the full-text search
+index (see ``core/search/fts.py``) and the suggestion index
+(``core/search/suggest.py``) in sync with the searchable models and
+invalidate the cached search results (``core/search/cache.py``). The
+review handlers keep the materialized ``ReviewSummary`` up to date and
+invalidate the cached home page reviews (``core/reviews.py``).
+"""
+
+from django.db.models.signals import post_save, post_delete, pre_delete
+
+from django.contrib.auth.models import User
+
+from blog.models import Category, Comment, Post
+
+from .models import Review, ReviewSummary
+from .reviews import invalidate_reviews
+from .search import KINDS, KINDS_BY_MODEL, KINDS_BY_NAME
+from .search.cache import invalidate_search_cache
+from .search.fts import index_object, remove_documents, remove_object
+from .search.suggest import remove_suggestions, update_suggestions
+
+
+def searchable_saved(sender, instance, raw=False, **kwargs):
+    """(Re)index a saved object, or drop it if it is no longer searchable."""
+
+    if not raw:
+        index_object(instance)
+        update_suggestions(instance)
+        invalidate_search_cache()
+
+
+def _cascaded_documents(instance):
+    # Searchable objects deleted along with ``instance``, as (kind, pks)
+    if isinstance(instance, Category):
+        posts = Post.objects.filter(category=instance)
+        comments = Comment.objects.filter(post__category=instance)
+    elif isinstance(instance, Post):
+        posts = Post.objects.none()
+        comments = Comment.objects.filter(post=instance)
+    else:
+        return []
+    return [
+        (KINDS_BY_NAME['post'], list(posts.values_list('pk', flat=True))),
+        (KINDS_BY_NAME['comment'], list(comments.values_list('pk', flat=True))),
+    ]
+
+
+def searchable_deleting(sender, instance, origin=None, **kwargs):
+    """Remember the documents a cascading delete is about to remove."""
+
+    if origin is instance:
+        instance._search_cascade = _cascaded_documents(instance)
+
+
+def searchable_deleted(sender, instance, origin=None, **kwargs):
+    """Remove a deleted object (and what its deletion cascaded to) from the search index."""
+
+    if origin is not instance and hasattr(origin, '_search_cascade'):
+        # Removed in bulk with the object whose deletion cascaded here
+        return
+    remove_object(instance)
+    remove_suggestions(KINDS_BY_MODEL[type(instance)].name, [instance.pk])
+    for kind, pks in getattr(instance, '_search_cascade', ()):
+        remove_documents(kind, pks)
+        remove_suggestions(kind.name, pks)
+    invalidate_search_cache()
+
+
+def review_saved(sender, instance, created=False, raw=False, **kwargs):
+    """Move a new or re-rated review into the right star of the summary."""
+
+    if raw:
+        return
+    old_rating = None if created else instance.get_loaded_values().get('rating')
+    if created or old_rating != instance.rating:
+        ReviewSummary.adjust(added=instance.rating, removed=old_rating)
+    invalidate_reviews()
+    instance.remember_loaded_values()
+
+
+def review_deleted(sender, instance, **kwargs):
+    """Remove a deleted review from the summary."""
+
+    ReviewSummary.adjust(removed=instance.get_loaded_values().get('rating', instance.rating))
+    invalidate_reviews()
+
+
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    """Drop cached reviews showing a renamed or deleted user's name."""
+
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        # Logging in only records the time of the login
+        return
+    invalidate_reviews()
+
+
+pre_delete.connect(searchable_deleting, sender=Category, dispatch_uid='search_index_deleting_category')
+pre_delete.connect(searchable_deleting, sender=Post, dispatch_uid='search_index_deleting_post')
+
+post_save.connect(review_saved, sender=Review, dispatch_uid='review_summary_save')
+post_delete.connect(review_deleted, sender=Review, dispatch_uid='review_summary_delete')
+post_save.connect(user_changed, sender=User, dispatch_uid='reviews_user_save')
+post_delete.connect(user_changed, sender=User, dispatch_uid='reviews_user_delete')
+
+for kind in KINDS:
+    post_save.connect(searchable_saved, sender=kind.model, dispatch_uid=f'search_index_save_{kind.name}')
+    post_delete.connect(searchable_deleted, sender=kind.model, dispatch_uid=f'search_index_delete_{kind.name}')
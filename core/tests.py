@@ -1,3 +1,23 @@
 from django.test import TestCase
 
-# Create your tests here.
+from blog.models import Category
+
+from .cache import get_version
+from .search.cache import SEARCH_VERSION, get_search_cache
+
+
+class SearchCacheTests(TestCase):
+    """Cached search results are dropped once changes commit."""
+
+    def test_generation_bumped_on_commit(self):
+        cache = get_search_cache()
+        generation = get_version(SEARCH_VERSION)
+        cache.get_or_compute(('espresso', 'category'), lambda: [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Espresso', slug='espresso')
+            # A search run before the commit would still find the old results
+            self.assertEqual(get_version(SEARCH_VERSION), generation)
+            self.assertEqual(cache.get_or_compute(('espresso', 'category'), lambda: ['new']), [])
+        self.assertGreater(get_version(SEARCH_VERSION), generation)
+        self.assertEqual(cache.get_or_compute(('espresso', 'category'), lambda: ['new']), ['new'])
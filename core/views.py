@@ -3,15 +3,18 @@
 This module contains three small views:
 
 - submit_review: authenticated users can create or update a single
-  review tied to their account. Uses messages to provide feedback.
+  review tied to their account. Uses messages to provide feedback. The
+  review and the ``ReviewSummary`` are written in one transaction.
 - contact: accept a simple contact form via POST and save a Contact
   instance for later processing.
 - reserve: present and process a ReservationForm to create a
   reservation record.
 """
 
+from django.db import transaction
 from django.shortcuts import render, redirect
 from .models import Review, Contact
+from .reviews import get_home_reviews
 from .forms import ReviewForm, ReservationForm
 from django.contrib import messages
 
@@ -40,27 +43,33 @@ def submit_review(request):
             existing_reviews = Review.objects.get(user=request.user)
             form = ReviewForm(request.POST, instance=existing_reviews)
             if form.is_valid():
-                form.save()
+                # The review summary is adjusted in the same transaction
+                with transaction.atomic():
+                    form.save()
                 messages.success(request, 'Thank you! Your review has been updated.')
                 return redirect('index') #reirects to home page and confirms a success message
             else:
                 # If the form is invalid, provide some context to the
                 # index template and show an error message.
-                reviews = Review.objects.all().order_by('-date')[:3]
+                home = get_home_reviews()
                 messages.error(request, 'Please correct the errors below.')
-                return render(request, 'index.html', {'reviews': reviews})
+                return render(request, 'index.html', {
+                    'reviews': home.reviews,
+                    'review_summary': home.summary,
+                    'user_review': existing_reviews,
+                })
 
         except Review.DoesNotExist: #if no existing review is found, create a new one
             form = ReviewForm(request.POST) #this will create a new form instance   
             if form.is_valid():
                 review = form.save(commit=False)
                 review.user = request.user
-                review.save()
+                with transaction.atomic():
+                    review.save()
                 messages.success(request, 'Thank you! Your review has been submitted.')
                 return redirect('index')
             else:
                 # Invalid form on create: show an error and redirect
-                reviews = Review.objects.all().order_by('-date')[:3]
                 messages.error(request, 'Please correct the errors below.')
                 return redirect('index')
 
@@ -13,6 +13,8 @@ from django.contrib.auth import authenticate, login, logout
 
 from django.contrib import messages
 
+from cart.cart import Cart
+
 from .forms import SignupForm
 
 
@@ -45,8 +47,9 @@ def loginPage(request):
     """Authenticate and log a user in.
 
     The view reads the posted username/password and uses
-    ``authenticate``/``login``. On failure an informational message is
-    displayed. Consider adding rate limiting or throttling for
+    ``authenticate``/``login``. Any cart built while anonymous is merged
+    into the user's persistent cart. On failure an informational message
+    is displayed. Consider adding rate limiting or throttling for
     production use to mitigate brute-force attacks.
     """
 
@@ -57,7 +60,11 @@ def loginPage(request):
         user = authenticate(request, username=username, password=password)
 
         if user is not None:
+            # Grab the anonymous cart before login() switches the request
+            # to the user, then fold it into the user's persistent cart
+            anonymous_cart = Cart(request)
             login(request, user)
+            anonymous_cart.merge_into(Cart(request))
             return redirect('index')
         else:
             messages.info(request, 'Username OR password is incorrect')